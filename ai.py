@@ -1,97 +1,673 @@
+import multiprocessing
+import multiprocessing.util
 import random
-import copy
+import time
 from constants import *
+from book import OpeningBook
+from tablebase import Tablebases
+from evaluation import tapered
+from transposition import TranspositionTable, SharedTranspositionTable, EXACT, LOWER, UPPER
+from chess_engine import ChessGame, MOVE_ENPASSANT, MOVE_PROMOTION
+
+# Time management: expect this many more moves when splitting the clock,
+# and never plan to spend more than a quarter of what is left on one move
+MOVES_TO_GO = 30
+MAX_CLOCK_FRACTION = 0.25
+# How often (in nodes) the search looks at the clock and the stop flag
+CHECK_INTERVAL = 1024
+
+# Move ordering: piece values for most-valuable-victim/least-valuable-attacker,
+# and how many plies of killer moves are kept
+MVV_LVA_VALUES = {'p': 1, 'n': 3, 'b': 3, 'r': 5, 'q': 9, 'k': 20}
+MAX_PLY = 64
+
+# Centipawn values for delta pruning in quiescence, which skips captures that
+# cannot lift the score to alpha even with this margin
+PIECE_VALUES = {'p': 100, 'n': 320, 'b': 330, 'r': 500, 'q': 950, 'k': 0}
+DELTA_MARGIN = 200
+
+# Tablebase wins score below a mate the search found itself and above any
+# evaluation, less one per ply to mate so the quickest mate is preferred
+TABLEBASE_WIN = 9000
+
+class SearchAborted(Exception):
+    """Raised inside the search when the hard time, node budget or stop flag is hit"""
+
+# Lazy SMP helpers. Each helper process keeps one ChessAI attached to the shared
+# transposition table and searches the same position as the main process; they
+# only cooperate through the table, and stop when the main search sets the event.
+_helper = None
+
+def _init_helper(difficulty, hash_mb, tt_name, stop_event):
+    global _helper
+    _helper = ChessAI(difficulty, hash_mb, threads=1)
+    _helper.tt = SharedTranspositionTable(hash_mb, tt_name)
+    _helper.stop_event = stop_event
+
+def _helper_search(position, max_depth, deadline, max_nodes, seed, generation, check_interval):
+    """Search position until stopped; returns (depth, move, score, nodes)"""
+    _helper.check_interval = check_interval  # React to the stop event as fast as the main search
+    game = ChessGame()
+    game.set_position(*position)
+    _helper.new_search(game)
+    _helper.tt.generation = generation  # Age entries in step with the main process
+    valid_moves = game.generate_legal_moves()
+    # Shuffle the root moves so helpers fill the table with different subtrees first
+    random.Random(seed).shuffle(valid_moves)
+    move = _helper.iterative_deepening(game, valid_moves, max_depth, max_nodes=max_nodes,
+                                       deadline=deadline)
+    return _helper.completed_depth, move, _helper.best_score, _helper.nodes
+
+def close_at_exit(ai):
+    """Close ai when this process exits normally, as a pool worker does once the
+    pool is closed and joined"""
+    multiprocessing.util.Finalize(None, ai.close, exitpriority=10)
+
+# Background search for the GUI. One worker process owns the engines and takes
+# requests from a queue, so the frame loop never waits on a search. Each request
+# has an id; cancelling stores the id in a shared value, which aborts the search
+# and marks the result as stale. While the human thinks, the worker can ponder:
+# search the position after the reply it expects, without a time limit until
+# the GUI reports that the reply was played.
+class _Cancelled:
+    """Stands in for a stop event: set once the job has been cancelled"""
+    def __init__(self, cancelled, job_id):
+        self.cancelled = cancelled
+        self.job_id = job_id
+
+    def is_set(self):
+        return self.cancelled.value >= self.job_id
+
+def _worker_loop(requests, results, cancelled, ponderhit):
+    engines = {}
+    game = ChessGame()
+    while True:
+        job = requests.get()
+        if job is None:
+            break
+        if job == "new_game":
+            for ai in engines.values():
+                ai.new_game()
+            continue
+        job_id, difficulty, position, white_time, black_time, ponder = job
+        if cancelled.value >= job_id:
+            continue
+        if difficulty not in engines:
+            engines[difficulty] = ChessAI(difficulty)
+        ai = engines[difficulty]
+        game.set_position(*position)
+        game.white_time, game.black_time = white_time, black_time
+        ai.stop_event = _Cancelled(cancelled, job_id)
+        ai.ponderhit = ponderhit if ponder else None
+        move = ai.find_best_move(game)
+        reply = ai.predicted_reply(game, move) if move is not None else None
+        results.put((job_id, move, reply))
+    for ai in engines.values():
+        ai.close()
+
+class AIWorker:
+    def __init__(self):
+        self.requests = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.cancelled = multiprocessing.Value('q', 0, lock=False)
+        self.ponderhit = multiprocessing.Value('d', 0.0, lock=False)
+        self.process = multiprocessing.Process(target=_worker_loop,
+                                               args=(self.requests, self.results, self.cancelled,
+                                                     self.ponderhit))
+        self.process.start()
+        self.job_id = 0
+        self.pending = False
+        self.pondering = False
+        self.ponder_key = None
+        self.reply = None  # The reply the last search expects, for ponder()
+
+    def request(self, game, difficulty):
+        """Start searching the current position of game in the background. If the
+        worker is pondering this very position, its search just gets a time limit."""
+        if self.pondering and game.zobrist_key == self.ponder_key:
+            self.ponderhit.value = time.perf_counter()
+            self.pondering = False
+            return
+        self.send(game.get_position(), game.white_time, game.black_time, difficulty, False)
+
+    def ponder(self, game, reply, difficulty):
+        """Search the position after reply on the opponent's time"""
+        game.make_move(reply)
+        self.ponder_key = game.zobrist_key
+        position = game.get_position()
+        game.unmake_move()
+        self.ponderhit.value = 0.0
+        self.send(position, game.white_time, game.black_time, difficulty, True)
+        self.pondering = True
+
+    def send(self, position, white_time, black_time, difficulty, ponder):
+        self.cancel()
+        self.job_id += 1
+        self.pending = True
+        self.requests.put((self.job_id, difficulty, position, white_time, black_time, ponder))
+
+    def poll(self):
+        """Return the requested move once it is ready, otherwise None"""
+        while self.pending and not self.pondering and not self.results.empty():
+            job_id, move, reply = self.results.get()
+            if job_id == self.job_id:
+                self.pending = False
+                self.reply = reply
+                return move
+        return None
+
+    def cancel(self):
+        """Abandon the pending request or ponder search, if any"""
+        if self.pending:
+            self.cancelled.value = self.job_id
+            self.pending = False
+        self.pondering = False
+
+    def new_game(self):
+        """Forget what the engines learned in the previous game"""
+        self.cancel()
+        self.requests.put("new_game")
+
+    def close(self):
+        self.cancel()
+        self.requests.put(None)
+        self.process.join()
 
 class ChessAI:
-    def __init__(self, difficulty="medium"):
+    def __init__(self, difficulty="medium", hash_mb=AI_HASH_MB, threads=AI_THREADS,
+                 book_path=AI_BOOK_PATH, tablebase_path=AI_TABLEBASE_PATH):
         self.difficulty = difficulty
-        self.depth = AI_DIFFICULTIES[difficulty]["depth"]
+        settings = AI_DIFFICULTIES[difficulty]
+        self.depth = settings["depth"]
+        self.movetime = settings.get("movetime")  # Seconds per move, None for clock only
+        self.max_nodes = settings.get("nodes")  # Node budget per move, None for no limit
+        self.quiescence_checks = settings.get("quiescence_checks", False)
+        self.book = OpeningBook(book_path) if book_path and settings.get("book") else None
+        self.tablebases = Tablebases(tablebase_path) if tablebase_path and settings.get("tablebase") else None
+        self.hash_mb = hash_mb
+        self.threads = threads  # Search processes, including this one
+        self.tt = TranspositionTable(hash_mb) if threads == 1 else SharedTranspositionTable(hash_mb)
+        self.pool = None
+        self.helper_stop = None
+        self.stop_event = None  # Anything with is_set(), checked alongside stop_requested
+        self.check_interval = CHECK_INTERVAL  # Lower it to react to stop_event sooner
+        self.on_iteration = None  # Called with (depth, score, move) after each iteration
+        # Pondering: a shared value that is 0 while the expected reply has not been
+        # played, then the perf_counter time it was; the search then gets whatever
+        # the soft time limit has left
+        self.ponderhit = None
+        self.ponder_soft_deadline = None
+        self.soft_deadline = float("inf")
+        self.nodes = 0
+        self.completed_depth = 0
+        self.best_score = None  # Score of completed_depth's best move, None before depth 1
+        self.stop_requested = False
+        self.deadline = float("inf")
+        self.node_limit = None
+        self.root_ply = 0
+        self.last_root_ply = 0
+        # Quiet moves that caused cutoffs: two killers per ply, and a history
+        # score per side indexed by start and end square. Both carry over from
+        # one move to the next, as does the transposition table.
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = {'w': [0] * 4096, 'b': [0] * 4096}
+
+    def new_search(self, game):
+        """Age what earlier searches learned before searching game's position"""
+        root_ply = game.ply()
+        shift = root_ply - self.last_root_ply
+        if 0 <= shift < MAX_PLY:
+            # Killers are indexed by ply from the root, which has moved on by shift
+            self.killers = self.killers[shift:] + [[0, 0] for _ in range(shift)]
+        else:
+            self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.last_root_ply = root_ply
+        for color, table in self.history.items():
+            self.history[color] = [score >> 1 for score in table]
+        self.tt.new_search()
+
+    def clear(self):
+        """Forget the transposition table, killers and history"""
+        self.tt.clear()
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = {'w': [0] * 4096, 'b': [0] * 4096}
+
+    def new_game(self):
+        """Get ready for a game unrelated to the positions searched so far"""
+        self.clear()
+        self.last_root_ply = 0
+        self.completed_depth = 0
+        self.best_score = None
         
-    def find_best_move(self, game):
-        valid_moves = []
-        for r in range(8):
-            for c in range(8):
-                piece = game.board[r][c]
-                if (piece[0] == 'b' and not game.white_to_move) or (piece[0] == 'w' and game.white_to_move):
-                    moves = game.get_valid_moves((r, c))
-                    for move in moves:
-                        # Only use the position part for AI moves
-                        valid_moves.append(((r, c), move[:2]))
+    def find_best_move(self, game, depth=None, movetime=None, nodes=None):
+        """Pick a move for the side to move. depth, movetime and nodes override the
+        difficulty's limits for this call; a depth or node budget given without a
+        movetime is not cut short by the difficulty's movetime, only by the clock."""
+        valid_moves = game.generate_legal_moves()
+        # Moves from the book, tablebases or a shallow difficulty are not searched,
+        # so they report no nodes, depth or score
+        self.nodes = 0
+        self.completed_depth = 0
+        self.best_score = None
         
         if not valid_moves:
             return None
             
         if self.difficulty == "easy":
             return random.choice(valid_moves)
-        else:
+        
+        if self.book:
+            move = self.book.choose(game, AI_BOOK_WEIGHTED)
+            if move is not None:
+                return move
+        
+        if self.tablebases:
+            move = self.tablebase_move(game, valid_moves)
+            if move is not None:
+                return move
+        
+        if self.difficulty == "medium":
             best_move = None
             best_score = -9999 if game.white_to_move else 9999
             
+            # Search on the game itself, taking every move back afterwards
             for move in valid_moves:
-                game_copy = copy.deepcopy(game)
-                game_copy.move_piece(move[0], move[1])
-                
-                if self.difficulty == "medium":
-                    score = self.evaluate_board(game_copy)
-                else:  # hard
-                    score = self.minimax(game_copy, self.depth-1, -10000, 10000, not game.white_to_move)
+                game.make_move(move)
+                score = self.evaluate_board(game)
+                game.unmake_move()
                 
                 if (game.white_to_move and score > best_score) or (not game.white_to_move and score < best_score):
                     best_score = score
                     best_move = move
                     
             return best_move
+        if movetime is None and (depth or nodes):
+            movetime = float("inf")
+        self.new_search(game)
+        if self.threads > 1:
+            return self.parallel_search(game, valid_moves, depth or self.depth,
+                                        movetime or self.movetime, nodes or self.max_nodes)
+        else:  # hard
+            return self.iterative_deepening(game, valid_moves, depth or self.depth,
+                                            movetime or self.movetime, nodes or self.max_nodes)
 
-    def evaluate_board(self, game):
-        piece_values = {
-            'p': 1, 'n': 3, 'b': 3, 'r': 5, 'q': 9, 'k': 0
-        }
+    def parallel_search(self, game, valid_moves, max_depth, movetime=None, max_nodes=None):
+        """Lazy SMP: helper processes search the same position through the shared
+        transposition table while this process runs the normal search. The move from
+        the deepest completed iteration wins, this process's on a tie."""
+        if self.pool is None:
+            self.helper_stop = multiprocessing.Event()
+            self.pool = multiprocessing.Pool(self.threads - 1, _init_helper,
+                                             (self.difficulty, self.hash_mb, self.tt.name,
+                                              self.helper_stop))
+        self.helper_stop.clear()
+        soft, hard = self.allocate_time(game, movetime)
+        position = game.get_position()
+        helpers = [self.pool.apply_async(_helper_search,
+                                         (position, max_depth, time.perf_counter() + hard,
+                                          max_nodes, seed, self.tt.generation, self.check_interval))
+                   for seed in range(1, self.threads)]
+        try:
+            best_move = self.iterative_deepening(game, valid_moves, max_depth, movetime, max_nodes)
+        finally:
+            self.helper_stop.set()
+            results = [helper.get() for helper in helpers]
+        for depth, move, score, nodes in results:
+            self.nodes += nodes
+            if depth > self.completed_depth and move is not None:
+                best_move, self.best_score, self.completed_depth = move, score, depth
+        return best_move
+
+    def close(self):
+        """Stop the helper processes, free the shared transposition table and close
+        the book and tablebases"""
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if self.tablebases is not None:
+            self.tablebases.close()
+            self.tablebases = None
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.threads > 1 and self.tt is not None:
+            self.tt.close()
+            self.tt = None
+
+    def tablebase_move(self, game, valid_moves):
+        """The move with the best tablebase result: the quickest mate when winning,
+        the longest defence when losing. None if the position is not covered."""
+        if self.tablebases.probe(game) is None:
+            return None
+        best_move, best_rank = None, None
+        for move in valid_moves:
+            game.make_move(move)
+            result = self.tablebases.probe(game)
+            game.unmake_move()
+            if result is None:  # A capture into a table that has not been built
+                return None
+            # The result is the opponent's, so their loss ranks first
+            outcome, plies = result
+            rank = (outcome, plies if outcome < 0 else -plies)
+            if best_rank is None or rank < best_rank:
+                best_move, best_rank = move, rank
+        return best_move
+
+    def allocate_time(self, game, movetime=None):
+        """Soft and hard time limits in seconds for this move. No new iteration starts
+        after the soft limit; the search is abandoned at the hard limit."""
+        remaining = max(game.white_time if game.white_to_move else game.black_time, 0.05)
+        soft = remaining / MOVES_TO_GO
+        hard = min(soft * 4, remaining * MAX_CLOCK_FRACTION)
+        if movetime:
+            soft = min(soft, movetime / 2)
+            hard = min(hard, movetime)
+        return soft, hard
+
+    def iterative_deepening(self, game, valid_moves, max_depth, movetime=None, max_nodes=None,
+                            deadline=None):
+        """Search depth 1, 2, ... until a limit is hit, returning the best move of the
+        deepest completed iteration. A deadline replaces the clock-based time limits.
+        If not even depth 1 completes, the first move is returned unscored:
+        completed_depth is 0 and best_score None."""
+        start = time.perf_counter()
+        if deadline is None:
+            soft, hard = self.allocate_time(game, movetime)
+            self.soft_deadline = start + soft
+            self.deadline = start + hard
+        else:
+            self.soft_deadline = float("inf")
+            self.deadline = deadline
+        if self.ponderhit is not None:
+            self.ponder_soft_deadline = self.soft_deadline
+            self.soft_deadline = self.deadline = float("inf")
+        self.node_limit = max_nodes
+        self.nodes = 0
+        self.completed_depth = 0
+        self.best_score = None
+        self.stop_requested = False
+        self.root_ply = root_ply = len(game.state_log)
+        
+        best_move = valid_moves[0]
+        for depth in range(1, max_depth + 1):
+            # Try the previous iteration's best move first
+            valid_moves.remove(best_move)
+            valid_moves.insert(0, best_move)
+            try:
+                move, score = self.search_root(game, valid_moves, depth)
+            except SearchAborted:
+                # Unwind the moves the aborted iteration left on the board
+                while len(game.state_log) > root_ply:
+                    game.unmake_move()
+                break
+            best_move, self.best_score = move, score
+            self.completed_depth = depth
+            if self.on_iteration:
+                self.on_iteration(depth, score, move)
+            self.check_ponderhit()
+            if abs(score) >= 9999 or time.perf_counter() >= self.soft_deadline:
+                break
+        return best_move
+
+    def search_root(self, game, valid_moves, depth):
+        maximizing = game.white_to_move
+        alpha, beta = -10000, 10000
+        best_move = None
+        best_score = -10000 if maximizing else 10000
+        for move in valid_moves:
+            game.make_move(move)
+            score = self.minimax(game, depth - 1, alpha, beta, not maximizing)
+            game.unmake_move()
+            if (maximizing and score > best_score) or (not maximizing and score < best_score):
+                best_score = score
+                best_move = move
+                if maximizing:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+        return best_move, best_score
+
+    def stop(self):
+        """Ask a running search to finish with the best move found so far"""
+        self.stop_requested = True
+
+    def ordered_moves(self, game, hash_move, ply):
+        """Yield legal moves lazily in stages: the hash move, captures by MVV-LVA,
+        killer moves, then quiet moves by history score. A stage is only generated
+        once the earlier ones have failed to produce a cutoff."""
+        board = game.board
+        color = 'w' if game.white_to_move else 'b'
+        
+        # Stage 1: the best move the transposition table remembers for this position.
+        # A key collision or a torn entry in the shared table can hand back a move
+        # that is not legal here, so check it before playing it.
+        if hash_move and not game.is_legal(hash_move):
+            hash_move = None
+        if hash_move:
+            yield hash_move
+        
+        # Stage 2: captures, most valuable victim first, cheapest attacker breaking ties
+        captures = game.generate_captures()
+        captures.sort(key=lambda move: self.mvv_lva(board, move), reverse=True)
+        for move in captures:
+            if move != hash_move:
+                yield move
+        
+        # Stage 3: killer moves that are legal quiet moves here
+        done = set(captures)
+        done.add(hash_move)
+        quiets = [move for move in game.generate_legal_moves() if move not in done]
+        killers = self.killers[ply] if ply < MAX_PLY else []
+        for move in killers:
+            if move in quiets:
+                yield move
         
-        score = 0
-        for r in range(8):
-            for c in range(8):
-                piece = game.board[r][c]
-                if piece != "--":
-                    value = piece_values[piece[1]]
-                    if piece[0] == 'w':
-                        score += value
-                    else:
-                        score -= value
-                        
-        return score
+        # Stage 4: remaining quiet moves, best history score first
+        history = self.history[color]
+        quiets = [move for move in quiets if move not in killers]
+        quiets.sort(key=lambda move: history[move & 4095], reverse=True)
+        yield from quiets
+
+    def mvv_lva(self, board, move):
+        """Capture ordering key: most valuable victim first, cheapest attacker breaking ties"""
+        victim = board[(move >> 9) & 7][(move >> 6) & 7]
+        attacker = board[(move >> 3) & 7][move & 7]
+        return MVV_LVA_VALUES[victim[1] if victim != "--" else 'p'] * 32 - MVV_LVA_VALUES[attacker[1]]
+
+    def record_cutoff(self, game, move, depth, ply):
+        """Remember a quiet move that caused a beta cutoff as a killer and in history"""
+        if game.board[(move >> 9) & 7][(move >> 6) & 7] != "--" or move >> 12 == MOVE_ENPASSANT:
+            return
+        if move >> 12 >= MOVE_PROMOTION:
+            return
+        if ply < MAX_PLY and self.killers[ply][0] != move:
+            self.killers[ply] = [move, self.killers[ply][0]]
+        self.history['w' if game.white_to_move else 'b'][move & 4095] += depth * depth
+
+    def check_ponderhit(self):
+        """Once the pondered reply is played, the search may only use what is left
+        of the soft time limit, counted from when pondering started; no new
+        iteration gets to run on to the hard limit. If pondering already used it
+        all, stop now with the deepest completed iteration."""
+        if self.ponderhit is not None and self.ponderhit.value:
+            self.soft_deadline = self.deadline = max(self.ponder_soft_deadline, self.ponderhit.value)
+            self.ponderhit = None
+
+    def predicted_reply(self, game, move):
+        """The opponent's best reply to move according to the transposition table"""
+        game.make_move(move)
+        entry = self.tt.probe(game.zobrist_key)
+        reply = entry[3] if entry and entry[3] in game.generate_legal_moves() else None
+        game.unmake_move()
+        return reply
+
+    def principal_variation(self, game, move, max_length=MAX_PLY):
+        """move followed by the best replies stored in the transposition table"""
+        line = [move]
+        seen = set()
+        game.make_move(move)
+        while len(line) < max_length and game.zobrist_key not in seen:
+            seen.add(game.zobrist_key)
+            entry = self.tt.probe(game.zobrist_key)
+            if not entry or entry[3] not in game.generate_legal_moves():
+                break
+            line.append(entry[3])
+            game.make_move(entry[3])
+        for _ in line:
+            game.unmake_move()
+        return line
+
+    def check_limits(self):
+        self.check_ponderhit()
+        if (self.stop_requested or time.perf_counter() >= self.deadline
+                or (self.node_limit and self.nodes >= self.node_limit)
+                or (self.stop_event and self.stop_event.is_set())):
+            raise SearchAborted()
+
+    def evaluate_board(self, game):
+        """Tapered material and piece-square score in centipawns, White positive"""
+        return tapered(game.eval_mg, game.eval_eg, game.phase)
 
     def minimax(self, game, depth, alpha, beta, maximizing_player):
-        if depth == 0 or game.checkmate or game.stalemate:
-            return self.evaluate_board(game)
-            
-        valid_moves = []
-        for r in range(8):
-            for c in range(8):
-                piece = game.board[r][c]
-                if (piece[0] == 'w' and maximizing_player) or (piece[0] == 'b' and not maximizing_player):
-                    moves = game.get_valid_moves((r, c))
-                    for move in moves:
-                        valid_moves.append(((r, c), move[:2]))
+        self.nodes += 1
+        if self.nodes % self.check_interval == 0:
+            self.check_limits()
+        if self.tablebases:
+            result = self.tablebases.probe(game)
+            if result is not None:
+                outcome, plies = result
+                score = outcome * (TABLEBASE_WIN - plies)
+                return score if game.white_to_move else -score
+        if depth == 0:
+            return self.quiescence(game, alpha, beta, maximizing_player)
         
+        # Reuse what an earlier visit of this position found
+        hash_move = None
+        entry = self.tt.probe(game.zobrist_key)
+        if entry:
+            entry_depth, bound, score, hash_move = entry
+            if entry_depth >= depth:
+                if bound == EXACT:
+                    return score
+                if bound == LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if beta <= alpha:
+                    return score
+            
+        ply = len(game.state_log) - self.root_ply
+        window_alpha, window_beta = alpha, beta
+        best_move = None
+        searched = 0
         if maximizing_player:
             max_eval = -9999
-            for move in valid_moves:
-                game_copy = copy.deepcopy(game)
-                game_copy.move_piece(move[0], move[1])
-                eval = self.minimax(game_copy, depth-1, alpha, beta, False)
-                max_eval = max(max_eval, eval)
+            for move in self.ordered_moves(game, hash_move, ply):
+                searched += 1
+                game.make_move(move)
+                eval = self.minimax(game, depth-1, alpha, beta, False)
+                game.unmake_move()
+                if eval > max_eval or best_move is None:
+                    max_eval = eval
+                    best_move = move
                 alpha = max(alpha, eval)
                 if beta <= alpha:
+                    self.record_cutoff(game, move, depth, ply)
                     break
-            return max_eval
+            best_eval = max_eval
         else:
             min_eval = 9999
-            for move in valid_moves:
-                game_copy = copy.deepcopy(game)
-                game_copy.move_piece(move[0], move[1])
-                eval = self.minimax(game_copy, depth-1, alpha, beta, True)
-                min_eval = min(min_eval, eval)
+            for move in self.ordered_moves(game, hash_move, ply):
+                searched += 1
+                game.make_move(move)
+                eval = self.minimax(game, depth-1, alpha, beta, True)
+                game.unmake_move()
+                if eval < min_eval or best_move is None:
+                    min_eval = eval
+                    best_move = move
                 beta = min(beta, eval)
                 if beta <= alpha:
+                    self.record_cutoff(game, move, depth, ply)
                     break
-            return min_eval
\ No newline at end of file
+            best_eval = min_eval
+        
+        # No legal moves: checkmate or stalemate
+        if not searched:
+            if game.is_in_check():
+                return -9999 if maximizing_player else 9999
+            return 0
+        
+        if best_eval <= window_alpha:
+            bound = UPPER
+        elif best_eval >= window_beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.tt.store(game.zobrist_key, depth, bound, best_eval, best_move)
+        return best_eval
+
+    def quiescence(self, game, alpha, beta, maximizing_player, qply=0):
+        """Resolve captures at the leaves so the evaluation never lands mid-exchange.
+        The side to move may stand pat on the static evaluation; when in check every
+        evasion is searched instead, and with quiescence_checks the first ply also
+        tries quiet moves that give check."""
+        self.nodes += 1
+        if self.nodes % self.check_interval == 0:
+            self.check_limits()
+        
+        board = game.board
+        in_check = game.is_in_check()
+        if in_check:
+            moves = game.generate_legal_moves()
+            if not moves:
+                return -9999 if maximizing_player else 9999
+            best = -9999 if maximizing_player else 9999
+        else:
+            best = stand_pat = self.evaluate_board(game)
+            if maximizing_player:
+                if stand_pat >= beta:
+                    return stand_pat
+                alpha = max(alpha, stand_pat)
+            else:
+                if stand_pat <= alpha:
+                    return stand_pat
+                beta = min(beta, stand_pat)
+            moves = game.generate_captures()
+            moves.sort(key=lambda move: self.mvv_lva(board, move), reverse=True)
+            if self.quiescence_checks and qply == 0:
+                moves += self.checking_moves(game, moves)
+        
+        for move in moves:
+            # Delta pruning: skip captures that cannot reach the window even with a margin
+            victim = board[(move >> 9) & 7][(move >> 6) & 7]
+            if not in_check and victim != "--" and move >> 12 < MOVE_PROMOTION:
+                gain = PIECE_VALUES[victim[1]] + DELTA_MARGIN
+                if (maximizing_player and stand_pat + gain <= alpha) or \
+                        (not maximizing_player and stand_pat - gain >= beta):
+                    continue
+            
+            game.make_move(move)
+            score = self.quiescence(game, alpha, beta, not maximizing_player, qply + 1)
+            game.unmake_move()
+            if maximizing_player:
+                best = max(best, score)
+                alpha = max(alpha, score)
+            else:
+                best = min(best, score)
+                beta = min(beta, score)
+            if beta <= alpha:
+                break
+        return best
+
+    def checking_moves(self, game, captures):
+        """Quiet moves that give check"""
+        checks = []
+        skip = set(captures)
+        for move in game.generate_legal_moves():
+            if move not in skip:
+                game.make_move(move)
+                if game.is_in_check():
+                    checks.append(move)
+                game.unmake_move()
+        return checks
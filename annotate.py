@@ -0,0 +1,126 @@
+import argparse
+import multiprocessing
+import sys
+import time
+from chess_engine import ChessGame, move_to_uci
+from ai import ChessAI, close_at_exit
+from pgn import read_games
+
+# Centipawns a move gives away compared with the best move, by label. Mate
+# scores are capped first so a missed mate does not swamp the averages.
+CLASSIFICATIONS = [(300, "blunder"), (100, "mistake"), (50, "inaccuracy")]
+SCORE_CAP = 1000
+DEFAULT_MOVETIME = 0.5  # Seconds per position when neither a time nor a depth is given
+
+# Each pool process keeps one ChessAI for all the positions it is given, searching
+# in a single process since the pool already uses the cores
+_ai = None
+
+def search_position(job):
+    """Search the position after the first ply moves of a game; returns (game index,
+    ply, score, best move, depth reached) with the score in centipawns, White positive.
+    Score and best move are None if the budget ran out before depth 1 completed."""
+    global _ai
+    index, ply, fen, moves, movetime, depth = job
+    if _ai is None:
+        _ai = ChessAI("hard", threads=1, book_path=None, tablebase_path=None)  # Searched scores only
+        close_at_exit(_ai)
+    game = ChessGame()
+    game.load_fen(fen)
+    for move in moves[:ply]:
+        game.make_move(move)
+    game.white_time = game.black_time = float("inf")  # Only the budget applies
+    if not game.generate_legal_moves():
+        if game.is_in_check():
+            return index, ply, -9999 if game.white_to_move else 9999, None, 0
+        return index, ply, 0, None, 0
+    best = _ai.find_best_move(game, depth=depth, movetime=movetime)
+    if not _ai.completed_depth:
+        return index, ply, None, None, 0
+    return index, ply, _ai.best_score, best, _ai.completed_depth
+
+def classify(loss):
+    for threshold, label in CLASSIFICATIONS:
+        if loss >= threshold:
+            return label
+    return ""
+
+def annotate_games(records, movetime=None, depth=None, workers=None):
+    """Search every position of every game in records, a list of (start FEN,
+    encoded moves), on a process pool. A depth alone searches to that depth with
+    no time limit; with neither limit each position gets DEFAULT_MOVETIME. Returns
+    one list per game with a dict per move: ply, move, best, the depth reached
+    finding it, score before and after (White positive), the centipawns lost by
+    the player and its classification. A move next to an unscored position has
+    loss None and no label."""
+    if movetime is None and depth is None:
+        movetime = DEFAULT_MOVETIME
+    jobs = [(index, ply, fen, moves, movetime, depth)
+            for index, (fen, moves) in enumerate(records) for ply in range(len(moves) + 1)]
+    scores = {}
+    with multiprocessing.Pool(workers) as pool:
+        for index, ply, score, best, reached in pool.imap_unordered(search_position, jobs):
+            scores[index, ply] = (score, best, reached)
+        pool.close()
+        pool.join()
+
+    annotations = []
+    for index, (fen, moves) in enumerate(records):
+        white_first = fen.split()[1] == 'w' if len(fen.split()) > 1 else True
+        game_notes = []
+        for ply, move in enumerate(moves):
+            before, best, reached = scores[index, ply]
+            after = scores[index, ply + 1][0]
+            white = white_first == (ply % 2 == 0)
+            if before is None or after is None:
+                loss = None
+            elif move == best:
+                loss = 0  # A deeper look at the next position does not make the best move worse
+            else:
+                capped = [max(-SCORE_CAP, min(SCORE_CAP, s)) for s in (before, after)]
+                loss = max(0, capped[0] - capped[1]) if white else max(0, capped[1] - capped[0])
+            game_notes.append({"ply": ply, "white": white, "move": move, "best": best,
+                               "depth": reached, "score": before, "score_after": after,
+                               "loss": loss, "label": classify(loss) if loss is not None else ""})
+        annotations.append(game_notes)
+    return annotations
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate every move of finished games and flag mistakes")
+    parser.add_argument("pgn", nargs="+", help="PGN files")
+    parser.add_argument("--movetime", type=float,
+                        help=f"seconds per position (default {DEFAULT_MOVETIME}, or no limit with --depth)")
+    parser.add_argument("--depth", type=int, help="depth per position")
+    parser.add_argument("--workers", type=int, help="positions searched at once (default: all cores)")
+    args = parser.parse_args(argv)
+
+    games = [record for path in args.pgn for record in read_games(path)]
+    start = time.perf_counter()
+    annotations = annotate_games([(fen, moves) for headers, fen, moves in games],
+                                 args.movetime, args.depth, args.workers)
+    for (headers, fen, moves), notes in zip(games, annotations):
+        print(f"{headers.get('White', '?')} - {headers.get('Black', '?')}  {headers.get('Result', '*')}")
+        fields = fen.split()
+        first_move = int(fields[5]) if len(fields) > 5 else 1
+        offset = 1 if len(fields) > 1 and fields[1] == 'b' else 0
+        counts = {}
+        for note in notes:
+            move_number = first_move + (note["ply"] + offset) // 2
+            best = move_to_uci(note["best"]) if note["best"] is not None else "-"
+            score = f"{note['score_after']:+}" if note["score_after"] is not None else "?"
+            print(f"  {move_number:>3}{'.' if note['white'] else '...':<4} "
+                  f"{move_to_uci(note['move']):<6} {score:>6}  "
+                  f"best {best:<6} depth {note['depth']:>2}  {note['label']}")
+            if note["label"]:
+                side = "White" if note["white"] else "Black"
+                counts[side, note["label"]] = counts.get((side, note["label"]), 0) + 1
+        for side in ("White", "Black"):
+            summary = ", ".join(f"{label} {counts.get((side, label), 0)}" for _, label in CLASSIFICATIONS)
+            print(f"  {side}: {summary}")
+        print()
+    positions = sum(len(moves) + 1 for headers, fen, moves in games)
+    print(f"{len(games)} games, {positions} positions in {time.perf_counter() - start:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import argparse
+import sys
+import time
+from chess_engine import ChessGame
+from ai import ChessAI
+from perft import REFERENCE_POSITIONS
+
+def run_bench(fen, depth, threads):
+    """Search fen to a fixed depth, returning (seconds, nodes, move)"""
+    game = ChessGame()
+    game.load_fen(fen)
+    game.white_time = game.black_time = float("inf")  # Only the depth limits the search
+    ai = ChessAI("hard", threads=threads)
+    try:
+        # Start the helper processes with a throwaway search, so process startup is
+        # not counted as search time, then forget what it found
+        ai.find_best_move(game, depth=1, movetime=float("inf"))
+        ai.new_game()
+        start = time.perf_counter()
+        move = ai.find_best_move(game, depth=depth, movetime=float("inf"))
+        return time.perf_counter() - start, ai.nodes, move
+    finally:
+        ai.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fixed-depth search timing for the Hard AI")
+    parser.add_argument("--depth", type=int, default=5, help="search depth (default 5)")
+    parser.add_argument("--position", choices=REFERENCE_POSITIONS, action="append",
+                        help="reference position to search (default: all)")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="search process counts to compare (default 1 2 4 8)")
+    args = parser.parse_args(argv)
+
+    names = args.position or list(REFERENCE_POSITIONS)
+    totals = {threads: 0.0 for threads in args.threads}
+    for name in names:
+        fen = REFERENCE_POSITIONS[name][0]
+        print(f"{name}: {fen}")
+        for threads in args.threads:
+            elapsed, nodes, move = run_bench(fen, args.depth, threads)
+            totals[threads] += elapsed
+            nps = nodes / elapsed if elapsed > 0 else 0
+            print(f"  threads {threads}: {elapsed:8.3f}s  {nodes:>10} nodes  {nps:>8.0f} nps")
+    base = totals[args.threads[0]]
+    print("time to depth:")
+    for threads, elapsed in totals.items():
+        speedup = base / elapsed if elapsed > 0 else 0
+        print(f"  threads {threads}: {elapsed:8.3f}s  speedup {speedup:.2f}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
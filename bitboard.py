@@ -0,0 +1,418 @@
+# Bitboard position backend for ChessGame.
+# Squares use the same numbering as the encoded moves: square = row * 8 + col,
+# so a8 is bit 0 and h1 is bit 63. White pawns move towards lower squares.
+
+PIECES = ["wp", "wn", "wb", "wr", "wq", "wk", "bp", "bn", "bb", "br", "bq", "bk"]
+
+# Encoded move flags: move = start | end << 6 | flag << 12
+MOVE_NORMAL = 0
+MOVE_ENPASSANT = 1
+MOVE_CASTLE = 2
+MOVE_PROMOTION = 3  # MOVE_PROMOTION + index into PROMOTION_PIECES
+PROMOTION_PIECES = ['q', 'r', 'b', 'n']
+
+FULL = (1 << 64) - 1
+FILE_A = sum(1 << (r * 8) for r in range(8))
+FILE_H = FILE_A << 7
+RANK_3 = 0xFF << 40  # Row 5, where white double pushes pass through
+RANK_6 = 0xFF << 16  # Row 2, where black double pushes pass through
+
+def _on_board(r, c):
+    return 0 <= r < 8 and 0 <= c < 8
+
+def _leaper_table(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bits = 0
+        for dr, dc in offsets:
+            if _on_board(r + dr, c + dc):
+                bits |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(bits)
+    return table
+
+KNIGHT_ATTACKS = _leaper_table([(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)])
+KING_ATTACKS = _leaper_table([(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc])
+# Squares attacked by a pawn of the given color standing on a square
+PAWN_ATTACKS = {
+    'w': _leaper_table([(-1, -1), (-1, 1)]),
+    'b': _leaper_table([(1, -1), (1, 1)])
+}
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bits = 0
+        r, c = r + dr, c + dc
+        while _on_board(r, c):
+            bits |= 1 << (r * 8 + c)
+            r, c = r + dr, c + dc
+        table.append(bits)
+    return table
+
+# Rays as (table, positive) pairs; positive rays run towards higher squares,
+# so their nearest blocker is the lowest set bit, otherwise the highest
+ROOK_RAYS = [(_ray_table(1, 0), True), (_ray_table(0, 1), True),
+             (_ray_table(-1, 0), False), (_ray_table(0, -1), False)]
+BISHOP_RAYS = [(_ray_table(1, 1), True), (_ray_table(1, -1), True),
+               (_ray_table(-1, 1), False), (_ray_table(-1, -1), False)]
+
+def _relevant_mask(rays, sq):
+    # Occupancy that can change the attacks from sq: each ray minus its last square
+    mask = 0
+    for table, positive in rays:
+        ray = table[sq]
+        if ray:
+            edge = (ray & -ray) if not positive else 1 << (ray.bit_length() - 1)
+            mask |= ray & ~edge
+    return mask
+
+def _ray_attacks(rays, sq, occupied):
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+def _between_table():
+    # BETWEEN[a][b]: squares strictly between a and b when they share a line, else 0
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                bits = 0
+                rr, cc = r + dr, c + dc
+                while (dr or dc) and _on_board(rr, cc):
+                    table[sq][rr * 8 + cc] = bits
+                    bits |= 1 << (rr * 8 + cc)
+                    rr, cc = rr + dr, cc + dc
+    return table
+
+BETWEEN = _between_table()
+
+ROOK_MASKS = [_relevant_mask(ROOK_RAYS, sq) for sq in range(64)]
+BISHOP_MASKS = [_relevant_mask(BISHOP_RAYS, sq) for sq in range(64)]
+
+# Sliding attacks keyed by the relevant occupancy, like magic bitboards but
+# hashed by a dict instead of a multiply; entries are filled on first use so
+# importing the module stays cheap
+_ROOK_TABLE = [{} for _ in range(64)]
+_BISHOP_TABLE = [{} for _ in range(64)]
+
+def rook_attacks(sq, occupied):
+    key = occupied & ROOK_MASKS[sq]
+    attacks = _ROOK_TABLE[sq].get(key)
+    if attacks is None:
+        attacks = _ROOK_TABLE[sq][key] = _ray_attacks(ROOK_RAYS, sq, key)
+    return attacks
+
+def bishop_attacks(sq, occupied):
+    key = occupied & BISHOP_MASKS[sq]
+    attacks = _BISHOP_TABLE[sq].get(key)
+    if attacks is None:
+        attacks = _BISHOP_TABLE[sq][key] = _ray_attacks(BISHOP_RAYS, sq, key)
+    return attacks
+
+def piece_attacks(piece, sq, occupied):
+    """Squares attacked by piece standing on sq"""
+    kind = piece[1]
+    if kind == 'p':
+        return PAWN_ATTACKS[piece[0]][sq]
+    if kind == 'n':
+        return KNIGHT_ATTACKS[sq]
+    if kind == 'b':
+        return bishop_attacks(sq, occupied)
+    if kind == 'r':
+        return rook_attacks(sq, occupied)
+    if kind == 'q':
+        return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+    return KING_ATTACKS[sq]
+
+def squares(bits):
+    """Yield the square index of every set bit"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+class Bitboards:
+    def __init__(self, board):
+        # One bitboard per piece plus occupancy per color and overall
+        self.pieces = dict.fromkeys(PIECES, 0)
+        self.occupancy = {'w': 0, 'b': 0}
+        self.occupied = 0
+        self.piece_on = [None] * 64
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] != "--":
+                    self.toggle(board[r][c], r * 8 + c)
+
+        # Attack set of the piece on each square and the per-side unions of those
+        # sets. make/unmake only record which squares changed (stale); the sets are
+        # patched from that on the first attack query in a position
+        self.attacks_from = [0] * 64
+        for sq in squares(self.occupied):
+            self.attacks_from[sq] = piece_attacks(self.piece_on[sq], sq, self.occupied)
+        self.attack_maps = {}
+        self.stale = 0
+        self.attack_log = []
+
+    def toggle(self, piece, sq):
+        """Add piece to sq if absent, remove it if present"""
+        bit = 1 << sq
+        self.pieces[piece] ^= bit
+        self.occupancy[piece[0]] ^= bit
+        self.occupied ^= bit
+        self.piece_on[sq] = piece if self.occupied & bit else None
+
+    def make(self, changes):
+        """Apply a move's (piece, square) changes"""
+        self.attack_log.append((self.attacks_from, self.attack_maps, self.stale))
+        for piece, sq in changes:
+            self.toggle(piece, sq)
+            self.stale |= 1 << sq
+        self.attack_maps = {}
+
+    def unmake(self, changes):
+        """Take back make(changes), restoring the attack sets of the earlier position"""
+        for piece, sq in reversed(changes):
+            self.toggle(piece, sq)
+        self.attacks_from, self.attack_maps, self.stale = self.attack_log.pop()
+
+    def refresh_attacks(self):
+        """Update the attack sets for the stale squares: the pieces now on them and
+        the sliders whose rays cross them are the only ones whose attacks changed"""
+        attacks = self.attacks_from = self.attacks_from[:]
+        p = self.pieces
+        occupied = self.occupied
+        rooks = p['wr'] | p['wq'] | p['br'] | p['bq']
+        bishops = p['wb'] | p['wq'] | p['bb'] | p['bq']
+        refresh = self.stale & occupied
+        for sq in squares(self.stale):
+            attacks[sq] = 0
+            refresh |= (rook_attacks(sq, occupied) & rooks) | (bishop_attacks(sq, occupied) & bishops)
+        for sq in squares(refresh):
+            attacks[sq] = piece_attacks(self.piece_on[sq], sq, occupied)
+        self.stale = 0
+
+    def attacked_by(self, color):
+        """Bitboard of every square color's pieces attack"""
+        bits = self.attack_maps.get(color)
+        if bits is None:
+            if self.stale:
+                self.refresh_attacks()
+            attacks = self.attacks_from
+            bits = 0
+            pieces = self.occupancy[color]
+            while pieces:
+                low = pieces & -pieces
+                bits |= attacks[low.bit_length() - 1]
+                pieces ^= low
+            self.attack_maps[color] = bits
+        return bits
+
+    def to_board(self):
+        """Build the list-of-lists board view used for drawing"""
+        board = [["--"] * 8 for _ in range(8)]
+        for piece, bits in self.pieces.items():
+            for sq in squares(bits):
+                board[sq >> 3][sq & 7] = piece
+        return board
+
+    def attackers_to(self, sq, color, occupied=None):
+        """Bitboard of color's pieces attacking sq"""
+        if occupied is None:
+            occupied = self.occupied
+        p = self.pieces
+        enemy = 'b' if color == 'w' else 'w'
+        return ((PAWN_ATTACKS[enemy][sq] & p[color + 'p'])
+                | (KNIGHT_ATTACKS[sq] & p[color + 'n'])
+                | (KING_ATTACKS[sq] & p[color + 'k'])
+                | (rook_attacks(sq, occupied) & (p[color + 'r'] | p[color + 'q']))
+                | (bishop_attacks(sq, occupied) & (p[color + 'b'] | p[color + 'q'])))
+
+    def is_attacked(self, sq, color, occupied=None):
+        """Whether any of color's pieces attack sq"""
+        if occupied is None:
+            return bool(self.attacked_by(color) >> sq & 1)
+        p = self.pieces
+        enemy = 'b' if color == 'w' else 'w'
+        return bool((KNIGHT_ATTACKS[sq] & p[color + 'n'])
+                    or (PAWN_ATTACKS[enemy][sq] & p[color + 'p'])
+                    or (KING_ATTACKS[sq] & p[color + 'k'])
+                    or (rook_attacks(sq, occupied) & (p[color + 'r'] | p[color + 'q']))
+                    or (bishop_attacks(sq, occupied) & (p[color + 'b'] | p[color + 'q'])))
+
+    def pins_and_checks(self, color):
+        """Checkers of color's king, the mask of squares that answer a single check,
+        and a dict mapping each pinned piece's square to the ray it may move along"""
+        p = self.pieces
+        enemy = 'b' if color == 'w' else 'w'
+        king_sq = p[color + 'k'].bit_length() - 1
+        checkers = self.attackers_to(king_sq, enemy) if self.attacked_by(enemy) >> king_sq & 1 else 0
+        if not checkers:
+            check_mask = FULL
+        elif checkers & (checkers - 1):
+            check_mask = 0  # Double check: only the king can move
+        else:
+            check_mask = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+
+        # Enemy sliders lined up with the king through exactly one of our pieces
+        pinned = {}
+        own = self.occupancy[color]
+        snipers = ((rook_attacks(king_sq, 0) & (p[enemy + 'r'] | p[enemy + 'q']))
+                   | (bishop_attacks(king_sq, 0) & (p[enemy + 'b'] | p[enemy + 'q'])))
+        for sq in squares(snipers):
+            ray = BETWEEN[king_sq][sq]
+            blockers = ray & self.occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pinned[blockers.bit_length() - 1] = ray | 1 << sq
+        return checkers, check_mask, pinned
+
+    def king_safe_after(self, color, from_sq, to_sq, captured_sq=None):
+        """Whether color's king is safe after moving from_sq to to_sq, without touching the board"""
+        p = self.pieces
+        enemy = 'b' if color == 'w' else 'w'
+        from_bit = 1 << from_sq
+        to_bit = 1 << to_sq
+        removed = to_bit
+        occupied = (self.occupied & ~from_bit) | to_bit
+        if captured_sq is not None:
+            removed |= 1 << captured_sq
+            occupied &= ~(1 << captured_sq)
+        king = p[color + 'k']
+        king_sq = to_sq if king & from_bit else king.bit_length() - 1
+        keep = ~removed
+        if KNIGHT_ATTACKS[king_sq] & p[enemy + 'n'] & keep:
+            return False
+        if PAWN_ATTACKS[color][king_sq] & p[enemy + 'p'] & keep:
+            return False
+        if KING_ATTACKS[king_sq] & p[enemy + 'k']:
+            return False
+        if rook_attacks(king_sq, occupied) & (p[enemy + 'r'] | p[enemy + 'q']) & keep:
+            return False
+        if bishop_attacks(king_sq, occupied) & (p[enemy + 'b'] | p[enemy + 'q']) & keep:
+            return False
+        return True
+
+    def valid_moves(self, sq, piece, en_passant, castle_rights):
+        """Legal moves for the piece on sq in ChessGame.get_valid_moves' (r, c[, special]) format"""
+        moves = []
+        for move in self.legal_moves(piece[0], en_passant, castle_rights):
+            if move & 63 == sq:
+                to = (move >> 6) & 63
+                flag = move >> 12
+                if flag == MOVE_NORMAL:
+                    moves.append((to >> 3, to & 7))
+                elif flag == MOVE_ENPASSANT:
+                    moves.append((to >> 3, to & 7, "enpassant"))
+                elif flag == MOVE_CASTLE:
+                    moves.append((to >> 3, to & 7, "castle"))
+                elif flag == MOVE_PROMOTION:  # One entry per square; the piece is chosen later
+                    moves.append((to >> 3, to & 7, "promotion"))
+        return moves
+
+    def castle_moves(self, sq, color, castle_rights):
+        wk, wq, bk, bq = castle_rights
+        enemy = 'b' if color == 'w' else 'w'
+        if color == 'w':
+            row, kingside, queenside = 7, wk, wq
+        else:
+            row, kingside, queenside = 0, bk, bq
+        if sq != row * 8 + 4 or not (kingside or queenside) or self.is_attacked(sq, enemy):
+            return []
+        moves = []
+        base = row * 8
+        if kingside and not self.occupied >> (base + 5) & 3:
+            if not self.is_attacked(base + 5, enemy) and not self.is_attacked(base + 6, enemy):
+                moves.append((row, 6, "castle"))
+        if queenside and not self.occupied >> (base + 1) & 7:
+            if not self.is_attacked(base + 3, enemy) and not self.is_attacked(base + 2, enemy):
+                moves.append((row, 2, "castle"))
+        return moves
+
+    def legal_moves(self, color, en_passant, castle_rights, captures_only=False):
+        """Every legal move for color in one pass over the piece bitboards, as encoded moves"""
+        p = self.pieces
+        enemy = 'b' if color == 'w' else 'w'
+        occupied = self.occupied
+        enemy_occupancy = self.occupancy[enemy]
+        targets = enemy_occupancy if captures_only else FULL & ~self.occupancy[color]
+        checkers, check_mask, pinned = self.pins_and_checks(color)
+        moves = []
+        append = moves.append
+
+        # King: targets the enemy attacks are illegal, and so is the square behind the
+        # king on the line of a checking slider, which the king itself shadows
+        king_sq = p[color + 'k'].bit_length() - 1
+        king_targets = KING_ATTACKS[king_sq] & targets & ~self.attacked_by(enemy)
+        king_row, king_col = divmod(king_sq, 8)
+        for sq in squares(checkers & ~(p[enemy + 'p'] | p[enemy + 'n'])):
+            row, col = divmod(sq, 8)
+            behind_row = king_row + (king_row > row) - (king_row < row)
+            behind_col = king_col + (king_col > col) - (king_col < col)
+            if 0 <= behind_row < 8 and 0 <= behind_col < 8:
+                king_targets &= ~(1 << (behind_row * 8 + behind_col))
+        for to in squares(king_targets):
+            append(king_sq | to << 6)
+        if not check_mask:
+            return moves
+        if not checkers and not captures_only:
+            for row, col, _ in self.castle_moves(king_sq, color, castle_rights):
+                append(king_sq | (row * 8 + col) << 6 | MOVE_CASTLE << 12)
+        targets &= check_mask
+
+        # Pawns, set-wise: pushes and captures are shifts of the whole pawn bitboard
+        pawns = p[color + 'p']
+        empty = FULL & ~occupied
+        if color == 'w':
+            single = (pawns >> 8) & empty
+            pushes = [] if captures_only else [(single, 8), (((single & RANK_3) >> 8) & empty, 16)]
+            captures = [(((pawns & ~FILE_A) >> 9) & enemy_occupancy, 9),
+                        (((pawns & ~FILE_H) >> 7) & enemy_occupancy, 7)]
+            promotion_rank = 0xFF
+        else:
+            single = (pawns << 8) & empty
+            pushes = [] if captures_only else [(single, -8), (((single & RANK_6) << 8) & empty, -16)]
+            captures = [(((pawns & ~FILE_A) << 7) & enemy_occupancy, -7),
+                        (((pawns & ~FILE_H) << 9) & enemy_occupancy, -9)]
+            promotion_rank = 0xFF << 56
+        for bits, offset in pushes + captures:
+            for to in squares(bits & check_mask):
+                start = to + offset
+                if start in pinned and not pinned[start] >> to & 1:
+                    continue
+                if promotion_rank >> to & 1:
+                    for i in range(4):
+                        append(start | to << 6 | (MOVE_PROMOTION + i) << 12)
+                else:
+                    append(start | to << 6)
+        if en_passant:
+            # Removing two pawns from a rank can expose the king, so test the position directly
+            ep = en_passant[0] * 8 + en_passant[1]
+            captured_sq = ep + 8 if color == 'w' else ep - 8
+            for start in squares(PAWN_ATTACKS[enemy][ep] & pawns):
+                if self.king_safe_after(color, start, ep, captured_sq):
+                    append(start | ep << 6 | MOVE_ENPASSANT << 12)
+
+        # Pieces; a pinned knight can never move
+        for sq in squares(p[color + 'n']):
+            if sq not in pinned:
+                for to in squares(KNIGHT_ATTACKS[sq] & targets):
+                    append(sq | to << 6)
+        for sq in squares(p[color + 'b'] | p[color + 'q']):
+            for to in squares(bishop_attacks(sq, occupied) & targets & pinned.get(sq, FULL)):
+                append(sq | to << 6)
+        for sq in squares(p[color + 'r'] | p[color + 'q']):
+            for to in squares(rook_attacks(sq, occupied) & targets & pinned.get(sq, FULL)):
+                append(sq | to << 6)
+        return moves
@@ -1,6 +1,11 @@
-import pygame
 import copy
+import time
 from constants import *
+from bitboard import (Bitboards, MOVE_NORMAL, MOVE_ENPASSANT, MOVE_CASTLE,
+                      MOVE_PROMOTION, PROMOTION_PIECES, PAWN_ATTACKS, squares)
+from transposition import (ZOBRIST_PIECES, ZOBRIST_BLACK_TO_MOVE, ZOBRIST_EN_PASSANT,
+                           ZOBRIST_CASTLE, castle_mask, zobrist_key)
+from evaluation import PST_MG, PST_EG, PHASE_WEIGHTS, material_pst
 
 class CastleRights:
     def __init__(self, wk=True, wq=True, bk=True, bq=True):
@@ -9,8 +14,42 @@ class CastleRights:
         self.bk = bk  # Black kingside
         self.bq = bq  # Black queenside
 
+# Compact move encoding used by make_move/unmake_move and the AI search:
+# start square | end square << 6 | flag << 12, where square = row * 8 + col
+# (flags are defined in bitboard.py)
+def encode_move(start, end, special=None, promotion=None):
+    """Pack a (start, end, special) move into a single int"""
+    flag = MOVE_NORMAL
+    if special == "enpassant":
+        flag = MOVE_ENPASSANT
+    elif special == "castle":
+        flag = MOVE_CASTLE
+    elif special == "promotion":
+        flag = MOVE_PROMOTION + PROMOTION_PIECES.index(promotion or 'q')
+    return (start[0] * 8 + start[1]) | (end[0] * 8 + end[1]) << 6 | flag << 12
+
+def decode_move(move):
+    """Unpack an encoded move into (start, end, special, promotion)"""
+    start = divmod(move & 63, 8)
+    end = divmod((move >> 6) & 63, 8)
+    flag = move >> 12
+    if flag == MOVE_ENPASSANT:
+        return start, end, "enpassant", None
+    if flag == MOVE_CASTLE:
+        return start, end, "castle", None
+    if flag >= MOVE_PROMOTION:
+        return start, end, "promotion", PROMOTION_PIECES[flag - MOVE_PROMOTION]
+    return start, end, None, None
+
+def move_to_uci(move):
+    """Coordinate notation for an encoded move, e.g. e2e4 or e7e8q"""
+    start, end, special, promotion = decode_move(move)
+    text = "abcdefgh"[start[1]] + str(8 - start[0]) + "abcdefgh"[end[1]] + str(8 - end[0])
+    return text + promotion if promotion else text
+
 class ChessGame:
-    def __init__(self, game_mode="human_vs_human", ai_difficulty="medium"):
+    def __init__(self, game_mode="human_vs_human", ai_difficulty="medium", backend=ENGINE_BACKEND,
+                 clock=time.monotonic):
         self.board = [
             ["br", "bn", "bb", "bq", "bk", "bb", "bn", "br"],
             ["bp"] * 8,
@@ -31,6 +70,7 @@ class ChessGame:
         self.white_time = GAME_TIME
         self.black_time = GAME_TIME
         self.last_move_time = None
+        self.clock = clock  # Returns the current time in seconds, for the game timers
         self.game_status = "White's turn"
         self.game_mode = game_mode
         self.ai_difficulty = ai_difficulty
@@ -40,19 +80,121 @@ class ChessGame:
         self.black_castle = CastleRights(True, True)
         self.castle_rights_log = [CastleRights(True, True, True, True)]
         self.promotion_choice = None
+        self.start_ply = 0
+        self.halfmove_clock = 0  # Half moves since the last capture or pawn move
+        self.ai = None
+        # Irreversible state saved by make_move and restored by unmake_move
+        self.state_log = []
+        # Optional bitboard mirror of self.board used for move generation
+        self.backend = backend
+        self.bitboards = Bitboards(self.board) if backend == "bitboard" else None
+        # Zobrist key of the current position, updated incrementally by make_move
+        self.zobrist_key = zobrist_key(self.board, self.white_to_move,
+                                       (True, True, True, True), self.en_passant_possible)
+        # Material and piece-square sums for the AI evaluation, also updated by make_move
+        self.eval_mg, self.eval_eg, self.phase = material_pst(self.board)
+        # Legal moves and check state of positions the game has shown, by Zobrist key
+        self.position_cache = {}
 
     def is_in_bounds(self, r, c):
         """Check if coordinates are within the board bounds"""
         return 0 <= r < 8 and 0 <= c < 8
 
+    def load_fen(self, fen):
+        """Set up the position described by a FEN string; the move counters are optional"""
+        fields = fen.split()
+        board = []
+        for rank in fields[0].split('/'):
+            row = []
+            for ch in rank:
+                if ch.isdigit():
+                    row += ["--"] * int(ch)
+                else:
+                    row.append(('w' if ch.isupper() else 'b') + ch.lower())
+            board.append(row)
+        white_to_move = len(fields) < 2 or fields[1] == 'w'
+        rights = fields[2] if len(fields) > 2 else '-'
+        ep = fields[3] if len(fields) > 3 else '-'
+        en_passant = None if ep == '-' else (8 - int(ep[1]), ord(ep[0]) - ord('a'))
+        halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        fullmove = int(fields[5]) if len(fields) > 5 else 1
+        ply = 2 * (max(fullmove, 1) - 1) + (0 if white_to_move else 1)
+        self.set_position(board, white_to_move,
+                          ('K' in rights, 'Q' in rights, 'k' in rights, 'q' in rights), en_passant,
+                          ply, halfmove_clock)
+
+    def to_fen(self):
+        """The current position as a FEN string"""
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1].upper() if piece[0] == 'w' else piece[1]
+            ranks.append(rank + (str(empty) if empty else ""))
+        rights = ''.join(flag for flag, allowed in zip("KQkq", self.get_castle_tuple()) if allowed) or '-'
+        if self.en_passant_possible:
+            r, c = self.en_passant_possible
+            ep = "abcdefgh"[c] + str(8 - r)
+        else:
+            ep = '-'
+        return (f"{'/'.join(ranks)} {'w' if self.white_to_move else 'b'} {rights} {ep} "
+                f"{self.halfmove_clock} {self.ply() // 2 + 1}")
+
+    def get_position(self):
+        """The current position as (board, white_to_move, castle_tuple, en_passant, ply,
+        halfmove_clock)"""
+        return ([row[:] for row in self.board], self.white_to_move,
+                self.get_castle_tuple(), self.en_passant_possible, self.ply(), self.halfmove_clock)
+
+    def set_position(self, board, white_to_move, castle_rights, en_passant, ply=0, halfmove_clock=0):
+        """Set up a position from get_position's fields, clearing the game history"""
+        self.start_ply = ply  # Half moves played before this position
+        self.halfmove_clock = halfmove_clock
+        self.board = [row[:] for row in board]
+        self.white_to_move = white_to_move
+        wk, wq, bk, bq = castle_rights
+        self.white_castle = CastleRights(wk, wq)
+        self.black_castle = CastleRights(bk=bk, bq=bq)
+        self.castle_rights_log = [self.get_castle_rights()]
+        self.en_passant_possible = en_passant
+        
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] == "wk":
+                    self.white_king_pos = (r, c)
+                elif self.board[r][c] == "bk":
+                    self.black_king_pos = (r, c)
+        
+        self.move_log = []
+        self.move_history = []
+        self.state_log = []
+        self.checkmate = False
+        self.stalemate = False
+        self.animation = None
+        self.bitboards = Bitboards(self.board) if self.backend == "bitboard" else None
+        self.zobrist_key = zobrist_key(self.board, self.white_to_move, self.get_castle_tuple(),
+                                       self.en_passant_possible)
+        self.eval_mg, self.eval_eg, self.phase = material_pst(self.board)
+        self.update_game_status()
+
     def make_ai_move(self):
         if ((self.game_mode == "human_vs_ai" and not self.white_to_move) or 
             (self.game_mode == "ai_vs_ai")):
-            from ai import ChessAI
-            ai = ChessAI(self.ai_difficulty)
-            best_move = ai.find_best_move(self)
-            if best_move:
-                return self.move_piece(best_move[0], best_move[1])
+            # One engine per game, so each search starts from what the last one learned
+            if self.ai is None:
+                from ai import ChessAI
+                self.ai = ChessAI(self.ai_difficulty)
+            best_move = self.ai.find_best_move(self)
+            if best_move is not None:
+                start, end, special, promotion = decode_move(best_move)
+                return self.move_piece(start, end, promotion)
         return False
 
     def move_piece(self, start, end, promotion_choice=None):
@@ -75,38 +217,23 @@ class ChessGame:
         # Handle special moves
         captured = "--"
         if move_info["special"] == "enpassant":
-            captured_pos = (sr, ec)
             captured = self.board[sr][ec]
-            self.board[sr][ec] = "--"
-        elif move_info["special"] == "castle":
-            self.handle_castling(end)
         elif move_info["special"] == "promotion":
             if promotion_choice:
                 piece = piece[0] + promotion_choice
             else:
                 self.promotion_choice = (start, end)
                 return "promotion"
-        else:
+        elif move_info["special"] != "castle":
             captured = self.board[er][ec]
 
-        # Make the move
-        self.board[er][ec] = piece
-        self.board[sr][sc] = "--"
-        
-        # Update king position
-        if piece == "wk":
-            self.white_king_pos = (er, ec)
-        elif piece == "bk":
-            self.black_king_pos = (er, ec)
-            
-        # Update castling rights
-        self.update_castling_rights(piece, start)
+        self.update_timers()
         
-        # Set en passant if pawn moved two squares
-        if piece[1] == 'p' and abs(sr - er) == 2:
-            self.en_passant_possible = ((sr + er) // 2, sc)
-        else:
-            self.en_passant_possible = None
+        # Make the move, naming it first since SAN depends on the position before it
+        move = encode_move(start, end, move_info["special"], promotion_choice)
+        san = self.move_to_san(move)
+        self.make_move(move)
+        self.promotion_choice = None
             
         # Log the move
         self.move_log.append({
@@ -118,11 +245,9 @@ class ChessGame:
             "castle_rights": copy.deepcopy(self.get_castle_rights())
         })
         
-        self.add_move_to_history(start, end, piece, captured, move_info["special"])
-        self.update_timers()
+        self.move_history.append(san)
         
-        # Update turn and status
-        self.white_to_move = not self.white_to_move
+        # Update status for the side now to move
         self.update_game_status()
         
         # Set animation
@@ -138,6 +263,129 @@ class ChessGame:
         
         return True
 
+    def make_move(self, move):
+        """Play an encoded move, skipping timers, status, history and animation"""
+        sr, sc = divmod(move & 63, 8)
+        er, ec = divmod((move >> 6) & 63, 8)
+        flag = move >> 12
+        piece = self.board[sr][sc]
+        captured = self.board[er][ec]
+
+        self.state_log.append((
+            move,
+            piece,
+            captured,
+            self.en_passant_possible,
+            self.get_castle_tuple(),
+            self.white_king_pos,
+            self.black_king_pos,
+            self.zobrist_key,
+            (self.eval_mg, self.eval_eg, self.phase),
+            self.halfmove_clock
+        ))
+
+        # Handle special moves
+        if flag == MOVE_ENPASSANT:
+            self.board[sr][ec] = "--"
+        elif flag == MOVE_CASTLE:
+            self.handle_castling((er, ec))
+
+        self.board[er][ec] = piece if flag < MOVE_PROMOTION else piece[0] + PROMOTION_PIECES[flag - MOVE_PROMOTION]
+        self.board[sr][sc] = "--"
+        changes = self.piece_changes(move, piece, captured)
+        if self.bitboards:
+            self.bitboards.make(changes)
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE
+        for changed, sq in changes:
+            key ^= ZOBRIST_PIECES[changed][sq]
+            # The board is already updated, so a change is an addition if the piece is there now
+            if self.board[sq >> 3][sq & 7] == changed:
+                self.eval_mg += PST_MG[changed][sq]
+                self.eval_eg += PST_EG[changed][sq]
+                self.phase += PHASE_WEIGHTS[changed[1]]
+            else:
+                self.eval_mg -= PST_MG[changed][sq]
+                self.eval_eg -= PST_EG[changed][sq]
+                self.phase -= PHASE_WEIGHTS[changed[1]]
+        key ^= ZOBRIST_CASTLE[castle_mask(*self.state_log[-1][4])]
+        if self.en_passant_possible:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant_possible[1]]
+
+        # Update king position
+        if piece == "wk":
+            self.white_king_pos = (er, ec)
+        elif piece == "bk":
+            self.black_king_pos = (er, ec)
+
+        # Update castling rights, including a rook captured on its home square
+        self.update_castling_rights(piece, (sr, sc))
+        self.update_castling_rights(captured, (er, ec))
+
+        self.halfmove_clock = 0 if piece[1] == 'p' or captured != "--" else self.halfmove_clock + 1
+
+        # Set en passant if pawn moved two squares
+        if piece[1] == 'p' and abs(sr - er) == 2:
+            self.en_passant_possible = ((sr + er) // 2, sc)
+        else:
+            self.en_passant_possible = None
+
+        key ^= ZOBRIST_CASTLE[castle_mask(*self.get_castle_tuple())]
+        if self.en_passant_possible:
+            key ^= ZOBRIST_EN_PASSANT[sc]
+        self.zobrist_key = key
+        self.white_to_move = not self.white_to_move
+
+    def unmake_move(self):
+        """Take back the last make_move, restoring the saved irreversible state"""
+        (move, piece, captured, en_passant, castle, white_king_pos, black_king_pos, key,
+         (self.eval_mg, self.eval_eg, self.phase), self.halfmove_clock) = self.state_log.pop()
+        sr, sc = divmod(move & 63, 8)
+        er, ec = divmod((move >> 6) & 63, 8)
+        flag = move >> 12
+
+        if self.bitboards:
+            self.bitboards.unmake(self.piece_changes(move, piece, captured))
+        self.board[sr][sc] = piece
+        self.board[er][ec] = captured
+        if flag == MOVE_ENPASSANT:
+            self.board[sr][ec] = ('b' if piece[0] == 'w' else 'w') + 'p'
+        elif flag == MOVE_CASTLE:
+            self.undo_castling((er, ec))
+
+        self.en_passant_possible = en_passant
+        self.white_castle.wk, self.white_castle.wq, self.black_castle.bk, self.black_castle.bq = castle
+        self.white_king_pos = white_king_pos
+        self.black_king_pos = black_king_pos
+        self.zobrist_key = key
+        self.white_to_move = not self.white_to_move
+
+    def piece_changes(self, move, piece, captured):
+        """The (piece, square) pairs an encoded move adds or removes, removals first"""
+        start = move & 63
+        end = (move >> 6) & 63
+        flag = move >> 12
+        placed = piece if flag < MOVE_PROMOTION else piece[0] + PROMOTION_PIECES[flag - MOVE_PROMOTION]
+        changes = [(piece, start)]
+        if captured != "--":
+            changes.append((captured, end))
+        changes.append((placed, end))
+        if flag == MOVE_ENPASSANT:
+            changes.append((('b' if piece[0] == 'w' else 'w') + 'p', (start & ~7) | (end & 7)))
+        elif flag == MOVE_CASTLE:
+            rook = piece[0] + 'r'
+            if end & 7 == 6:  # Kingside
+                changes += [(rook, end + 1), (rook, end - 1)]
+            else:  # Queenside
+                changes += [(rook, end - 2), (rook, end + 1)]
+        return changes
+
+    def ply(self):
+        """Half moves played in the game so far"""
+        return self.start_ply + len(self.state_log)
+
+    def get_castle_tuple(self):
+        return (self.white_castle.wk, self.white_castle.wq, self.black_castle.bk, self.black_castle.bq)
+
     def get_castle_rights(self):
         return CastleRights(self.white_castle.wk, 
                           self.white_castle.wq,
@@ -197,11 +445,53 @@ class ChessGame:
 
         return move_info
 
+    def position_info(self):
+        """Legal moves, check state and a per-square move list for the current
+        position, generated once and then read from the position cache. The move
+        lists are for the GUI and the status line; the search does not use this."""
+        info = self.position_cache.get(self.zobrist_key)
+        if info is None:
+            if len(self.position_cache) >= POSITION_CACHE_SIZE:
+                self.position_cache.clear()
+            info = self.position_cache[self.zobrist_key] = {
+                "moves": self.generate_legal_moves(),
+                "in_check": self.is_in_check(),
+                "by_square": None  # Filled in by the first get_valid_moves call
+            }
+        return info
+
     def get_valid_moves(self, start):
+        """Legal moves of the piece on start as (r, c[, special]) tuples; those of
+        the side to move come from the position cache"""
         r, c = start
         piece = self.board[r][c]
         if piece == "--":
             return []
+        if piece[0] != ('w' if self.white_to_move else 'b'):
+            return self.piece_moves(start)
+        
+        info = self.position_info()
+        if info["by_square"] is None:
+            by_square = {}
+            for move in info["moves"]:
+                move_start, end, special, promotion = decode_move(move)
+                target = end + (special,) if special else end
+                targets = by_square.setdefault(move_start, [])
+                if target not in targets:  # One entry per promotion square
+                    targets.append(target)
+            info["by_square"] = by_square
+        return list(info["by_square"].get(start, []))
+
+    def piece_moves(self, start):
+        """Legal moves of the piece on start as (r, c[, special]) tuples, generated afresh"""
+        r, c = start
+        piece = self.board[r][c]
+        if piece == "--":
+            return []
+            
+        if self.bitboards:
+            return self.bitboards.valid_moves(r * 8 + c, piece, self.en_passant_possible,
+                                              self.get_castle_tuple())
             
         color = piece[0]
         possible_moves = []
@@ -227,6 +517,170 @@ class ChessGame:
                 
         return valid_moves
 
+    def generate_legal_moves(self):
+        """Every legal move for the side to move, as encoded moves"""
+        if self.bitboards:
+            return self.bitboards.legal_moves('w' if self.white_to_move else 'b',
+                                              self.en_passant_possible, self.get_castle_tuple())
+        
+        # Mailbox backend: collect the per-square move lists
+        moves = []
+        color = 'w' if self.white_to_move else 'b'
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c][0] == color:
+                    for move in set(self.piece_moves((r, c))):
+                        special = move[2] if len(move) > 2 else None
+                        if special == "promotion":
+                            for promo in PROMOTION_PIECES:
+                                moves.append(encode_move((r, c), move[:2], special, promo))
+                        else:
+                            moves.append(encode_move((r, c), move[:2], special))
+        return moves
+
+    def parse_san(self, san):
+        """The legal encoded move written as san (e.g. Nbd7, exd6, e8=Q+, O-O).
+        Raises ValueError if no legal move or more than one matches."""
+        text = san.rstrip('+#!?')
+        if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+            col = 6 if len(text) == 3 else 2
+            matches = [move for move in self.generate_legal_moves()
+                       if move >> 12 == MOVE_CASTLE and (move >> 6) & 7 == col]
+        else:
+            promotion = None
+            if '=' in text:
+                text, promotion = text.split('=')
+                promotion = promotion.lower()
+            elif text[-1] in "QRBN" and text[0] in "abcdefgh":
+                text, promotion = text[:-1], text[-1].lower()
+            kind = text[0].lower() if text[0] in "NBRQK" else 'p'
+            body = text[1:] if kind != 'p' else text
+            body = body.replace('x', '').replace('-', '').replace(':', '')
+            if len(body) < 2 or body[-2] not in "abcdefgh" or body[-1] not in "12345678":
+                raise ValueError(f"Cannot read move {san}")
+            end = (8 - int(body[-1])) * 8 + "abcdefgh".index(body[-2])
+            hint = body[:-2]  # Disambiguating file and/or rank
+            matches = []
+            for move in self.moves_to(end, kind, promotion):
+                sr, sc = divmod(move & 63, 8)
+                if any(ch != ("abcdefgh"[sc] if ch.isalpha() else str(8 - sr)) for ch in hint):
+                    continue
+                matches.append(move)
+        if len(matches) != 1:
+            raise ValueError(f"{'Ambiguous' if matches else 'Illegal'} move {san}")
+        return matches[0]
+
+    def moves_to(self, end, kind, promotion=None):
+        """Legal non-castling moves of the side to move's pieces of kind ('p', 'n', ...)
+        that land on square end, promoting to promotion if given"""
+        if not self.bitboards:
+            return [move for move in self.generate_legal_moves()
+                    if (move >> 6) & 63 == end and move >> 12 != MOVE_CASTLE
+                    and self.board[(move & 63) >> 3][move & 7][1] == kind
+                    and (PROMOTION_PIECES[(move >> 12) - MOVE_PROMOTION]
+                         if move >> 12 >= MOVE_PROMOTION else None) == promotion]
+
+        # Bitboards: find the pieces that reach end and check only those moves
+        bitboards = self.bitboards
+        color = 'w' if self.white_to_move else 'b'
+        target = self.board[end >> 3][end & 7]
+        if target[0] == color:
+            return []
+        ep = self.en_passant_possible
+        ep_sq = ep[0] * 8 + ep[1] if ep else -1
+        flag = MOVE_NORMAL
+        if kind == 'p':
+            pawns = bitboards.pieces[color + 'p']
+            step = 8 if color == 'w' else -8  # From end back towards where the pawn came from
+            if target != "--" or end == ep_sq:
+                origins = list(squares(PAWN_ATTACKS['b' if color == 'w' else 'w'][end] & pawns))
+                if end == ep_sq:
+                    flag = MOVE_ENPASSANT
+            elif not 0 <= end + step < 64:
+                origins = []
+            elif pawns >> (end + step) & 1:
+                origins = [end + step]
+            elif (end >> 3 == (4 if color == 'w' else 3) and not bitboards.occupied >> (end + step) & 1
+                    and pawns >> (end + 2 * step) & 1):
+                origins = [end + 2 * step]
+            else:
+                origins = []
+            if end >> 3 in (0, 7):
+                if promotion not in PROMOTION_PIECES:
+                    return []
+                flag = MOVE_PROMOTION + PROMOTION_PIECES.index(promotion)
+            elif promotion:
+                return []
+        else:
+            if promotion:
+                return []
+            origins = squares(bitboards.attackers_to(end, color) & bitboards.pieces[color + kind])
+        captured_sq = end + (8 if color == 'w' else -8) if flag == MOVE_ENPASSANT else None
+        return [origin | end << 6 | flag << 12 for origin in origins
+                if bitboards.king_safe_after(color, origin, end, captured_sq)]
+
+    def is_legal(self, move):
+        """Whether an encoded move, e.g. one read from the transposition table, is
+        legal here; cheaper than generating every move with the bitboards"""
+        start, end, flag = move & 63, (move >> 6) & 63, move >> 12
+        piece = self.board[start >> 3][start & 7]
+        if piece == "--" or piece[0] != ('w' if self.white_to_move else 'b'):
+            return False
+        if flag > MOVE_PROMOTION + 3:
+            return False
+        if flag == MOVE_CASTLE or not self.bitboards:
+            return move in self.generate_legal_moves()
+        promotion = PROMOTION_PIECES[flag - MOVE_PROMOTION] if flag >= MOVE_PROMOTION else None
+        return move in self.moves_to(end, piece[1], promotion)
+
+    def move_to_san(self, move):
+        """Standard algebraic notation for a legal encoded move in the current position,
+        with just enough disambiguation and a + or # suffix"""
+        sr, sc = divmod(move & 63, 8)
+        er, ec = divmod((move >> 6) & 63, 8)
+        flag = move >> 12
+        piece = self.board[sr][sc]
+        files = "abcdefgh"
+        if flag == MOVE_CASTLE:
+            san = "O-O" if ec > sc else "O-O-O"
+        else:
+            capture = self.board[er][ec] != "--" or flag == MOVE_ENPASSANT
+            if piece[1] == 'p':
+                san = files[sc] + 'x' if capture else ""
+            else:
+                san = piece[1].upper()
+                # Other pieces of the same kind that can also reach the square
+                rivals = [m & 63 for m in self.position_info()["moves"]
+                          if (m >> 6) & 63 == er * 8 + ec and m & 63 != sr * 8 + sc
+                          and self.board[(m & 63) >> 3][m & 7] == piece]
+                if rivals:
+                    if all(rival & 7 != sc for rival in rivals):
+                        san += files[sc]
+                    elif all(rival >> 3 != sr for rival in rivals):
+                        san += str(8 - sr)
+                    else:
+                        san += files[sc] + str(8 - sr)
+                if capture:
+                    san += 'x'
+            san += files[ec] + str(8 - er)
+            if flag >= MOVE_PROMOTION:
+                san += '=' + PROMOTION_PIECES[flag - MOVE_PROMOTION].upper()
+        self.make_move(move)
+        after = self.position_info()
+        if after["in_check"]:
+            san += '#' if not after["moves"] else '+'
+        self.unmake_move()
+        return san
+
+    def generate_captures(self):
+        """Legal captures (including en passant) for the side to move, as encoded moves"""
+        if self.bitboards:
+            return self.bitboards.legal_moves('w' if self.white_to_move else 'b',
+                                              self.en_passant_possible, self.get_castle_tuple(),
+                                              captures_only=True)
+        return [move for move in self.generate_legal_moves()
+                if self.board[(move >> 9) & 7][(move >> 6) & 7] != "--" or move >> 12 == MOVE_ENPASSANT]
+
     def would_be_in_check(self, start, move, color):
         # Handle both regular and special moves
         if len(move) > 2:  # Special move with extra info
@@ -238,6 +692,10 @@ class ChessGame:
             
         sr, sc = start
         er, ec = end_pos
+        if self.bitboards:
+            captured_sq = sr * 8 + ec if special == "enpassant" else None
+            return not self.bitboards.king_safe_after(color, sr * 8 + sc, er * 8 + ec, captured_sq)
+        
         piece = self.board[sr][sc]
         original_piece = self.board[er][ec]
         
@@ -410,6 +868,9 @@ class ChessGame:
         if enemy_color is None:
             enemy_color = 'b' if self.white_to_move else 'w'
         
+        if self.bitboards:
+            return self.bitboards.is_attacked(r * 8 + c, enemy_color)
+        
         # Check pawn attacks
         direction = 1 if enemy_color == 'w' else -1
         for dc in [-1, 1]:
@@ -470,43 +931,28 @@ class ChessGame:
         return False
 
     def update_game_status(self):
-        if self.is_checkmate():
+        # One look at the cached position decides everything; the flags are set both
+        # ways so undoing a mate or stalemate reopens the game
+        info = self.position_info()
+        self.checkmate = info["in_check"] and not info["moves"]
+        self.stalemate = not info["in_check"] and not info["moves"]
+        if self.checkmate:
             winner = "Black" if self.white_to_move else "White"
             self.game_status = f"Checkmate! {winner} wins!"
-            self.checkmate = True
-        elif self.is_stalemate():
+        elif self.stalemate:
             self.game_status = "Stalemate!"
-            self.stalemate = True
-        elif self.is_in_check():
+        elif info["in_check"]:
             self.game_status = "White's turn (Check)" if self.white_to_move else "Black's turn (Check)"
         else:
             self.game_status = "White's turn" if self.white_to_move else "Black's turn"
 
     def is_checkmate(self):
-        if not self.is_in_check():
-            return False
-            
-        # Check if any move can get out of check
-        for r in range(8):
-            for c in range(8):
-                piece = self.board[r][c]
-                if (piece[0] == 'w' and self.white_to_move) or (piece[0] == 'b' and not self.white_to_move):
-                    if self.get_valid_moves((r, c)):
-                        return False
-        return True
+        info = self.position_info()
+        return info["in_check"] and not info["moves"]
 
     def is_stalemate(self):
-        if self.is_in_check():
-            return False
-            
-        # Check if any legal move exists
-        for r in range(8):
-            for c in range(8):
-                piece = self.board[r][c]
-                if (piece[0] == 'w' and self.white_to_move) or (piece[0] == 'b' and not self.white_to_move):
-                    if self.get_valid_moves((r, c)):
-                        return False
-        return True
+        info = self.position_info()
+        return not info["in_check"] and not info["moves"]
 
     def is_in_check(self):
         king_pos = self.white_king_pos if self.white_to_move else self.black_king_pos
@@ -514,7 +960,7 @@ class ChessGame:
 
     def update_timers(self):
         if self.last_move_time is not None:
-            current_time = pygame.time.get_ticks() / 1000  # Convert to seconds
+            current_time = self.clock()
             elapsed = current_time - self.last_move_time
             
             if self.white_to_move:
@@ -527,85 +973,29 @@ class ChessGame:
                 self.game_status = f"Time's up! {winner} wins!"
                 self.checkmate = True
                 
-        self.last_move_time = pygame.time.get_ticks() / 1000
+        self.last_move_time = self.clock()
 
     def format_time(self, seconds):
         minutes = int(seconds // 60)
         seconds = int(seconds % 60)
         return f"{minutes:02d}:{seconds:02d}"
 
-    def add_move_to_history(self, start, end, piece, captured, special=None):
-        sr, sc = start
-        er, ec = end
-        piece_type = piece[1]
-        color = piece[0]
-        
-        # Convert to algebraic notation
-        col_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
-        move_str = ""
-        
-        if piece_type != 'p':
-            move_str += piece_type.upper()
-        
-        if captured != "--":
-            if piece_type == 'p':
-                move_str += col_names[sc]
-            move_str += 'x'
-        
-        move_str += col_names[ec] + str(8 - er)
-        
-        if special == "castle":
-            if ec > sc:  # Kingside
-                move_str = "O-O"
-            else:  # Queenside
-                move_str = "O-O-O"
-        elif special == "promotion":
-            move_str += "=Q"  # Default to queen, actual choice will be shown
-        
-        self.move_history.append(move_str)
-
     def undo_move(self):
         if len(self.move_log) == 0:
             return False
             
-        last_move = self.move_log.pop()
-        start = last_move["start"]
-        end = last_move["end"]
-        piece = last_move["piece"]
-        captured = last_move["captured"]
-        special = last_move["special"]
-        
-        # Restore board position
-        self.board[start[0]][start[1]] = piece
-        self.board[end[0]][end[1]] = captured
-        
-        # Handle special moves
-        if special == "enpassant":
-            self.board[end[0]][start[1]] = captured
-            self.board[end[0]][end[1]] = "--"
-        elif special == "castle":
-            self.undo_castling(end)
-        
-        # Restore king position
-        if piece == "wk":
-            self.white_king_pos = start
-        elif piece == "bk":
-            self.black_king_pos = start
+        self.move_log.pop()
+        self.unmake_move()
         
-        # Restore castling rights
-        if len(self.castle_rights_log) > 0:
+        # Keep the castle rights log in step with the move log
+        if len(self.castle_rights_log) > 1:
             self.castle_rights_log.pop()
-            if len(self.castle_rights_log) > 0:
-                prev_rights = self.castle_rights_log[-1]
-                self.white_castle = CastleRights(prev_rights.wk, prev_rights.wq)
-                self.black_castle = CastleRights(prev_rights.bk, prev_rights.bq)
         
         # Remove last move from history
         if len(self.move_history) > 0:
             self.move_history.pop()
         
-        # Switch turns and update status
-        self.white_to_move = not self.white_to_move
+        # Update status
         self.update_game_status()
         self.update_timers()
         
@@ -620,21 +1010,31 @@ class ChessGame:
             self.board[r][0] = self.board[r][3]
             self.board[r][3] = "--"
 
+    def perft(self, depth):
+        """Count the leaf nodes of the legal move tree to the given depth"""
+        if depth == 0:
+            return 1
+        moves = self.generate_legal_moves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move()
+        return nodes
+
+    def divide(self, depth):
+        """Perft node counts split by root move, keyed by coordinate notation"""
+        counts = {}
+        for move in self.generate_legal_moves():
+            self.make_move(move)
+            counts[move_to_uci(move)] = self.perft(depth - 1)
+            self.unmake_move()
+        return counts
+
     def update_animation(self):
         if self.animation:
             self.animation["progress"] += ANIMATION_SPEED
             if self.animation["progress"] >= 100:
                 self.animation = None
-
-    def draw_animated_piece(self, screen):
-        if not self.animation:
-            return
-
-        progress = self.animation["progress"] / 100
-        sr, sc = self.animation["start"]
-        er, ec = self.animation["end"]
-        
-        x = sc * SQUARE_SIZE + (ec - sc) * SQUARE_SIZE * progress
-        y = sr * SQUARE_SIZE + (er - sr) * SQUARE_SIZE * progress
-        
-        screen.blit(PIECE_IMAGES[self.animation["piece"]], (x, y))
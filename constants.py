@@ -1,8 +1,5 @@
-import os
-import pygame
-
-# Initialize pygame for font loading
-pygame.init()
+# Plain settings only: the rules engine and the AI import this module, so it
+# must not pull in pygame. Fonts and piece images are loaded by main.py.
 
 # Window dimensions
 WIDTH = 1000
@@ -23,30 +20,19 @@ CHECK_COLOR = (255, 0, 0, 150)
 UI_BG = (240, 240, 240)
 TEXT_COLOR = (50, 50, 50)
 
-# Fonts
-FONT_LARGE = pygame.font.SysFont('Arial', 36)
-FONT_MEDIUM = pygame.font.SysFont('Arial', 24)
-FONT_SMALL = pygame.font.SysFont('Arial', 18)
-
 # Game settings
 FPS = 60
+IDLE_WAIT_MS = 100  # Longest the GUI sleeps waiting for input when nothing is moving
+TEXT_CACHE_SIZE = 256  # Rendered text surfaces kept by the GUI
 ANIMATION_SPEED = 15
 GAME_TIME = 600  # 10 minutes in seconds
-
-# Piece images
-PIECE_IMAGES = {}
-for color in ['w', 'b']:
-    for piece in ['p', 'r', 'n', 'b', 'q', 'k']:
-        key = f"{color}{piece}"
-        try:
-            img = pygame.image.load(f"assets/pieces/{key}.png")
-            PIECE_IMAGES[key] = pygame.transform.smoothscale(img, (SQUARE_SIZE, SQUARE_SIZE))
-        except:
-            # Fallback if image not found
-            surf = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-            pygame.draw.circle(surf, (200, 0, 0) if color == 'w' else (0, 0, 200), 
-                             (SQUARE_SIZE//2, SQUARE_SIZE//2), SQUARE_SIZE//3)
-            PIECE_IMAGES[key] = surf
+ENGINE_BACKEND = "bitboard"  # "bitboard" or "mailbox" (list-of-lists scan)
+POSITION_CACHE_SIZE = 4096  # Positions whose legal moves a ChessGame keeps, see position_info
+AI_HASH_MB = 16  # Transposition table size per AI
+AI_THREADS = 1  # Search processes for Hard; more than 1 shares the table between them
+AI_BOOK_PATH = None  # Polyglot opening book (.bin) for difficulties with "book", see book.py
+AI_BOOK_WEIGHTED = True  # Pick book moves at random by weight rather than always the heaviest
+AI_TABLEBASE_PATH = None  # Directory of endgame tables for difficulties with "tablebase", see tablebase.py
 
 # Game modes
 GAME_MODES = {
@@ -56,8 +42,15 @@ GAME_MODES = {
 }
 
 # AI difficulties
+# depth is the deepest iteration searched, movetime (seconds) and nodes cap
+# each move on top of the clock; None means no limit. quiescence_checks also
+# tries quiet checking moves at the first ply of the capture search, and ponder
+# lets the AI search on the human's time in Human vs AI. book plays moves from
+# AI_BOOK_PATH while the position is in it, and tablebase plays and scores
+# endings with up to four pieces from the tables in AI_TABLEBASE_PATH
 AI_DIFFICULTIES = {
     "easy": {"depth": 1, "name": "Easy"},
-    "medium": {"depth": 3, "name": "Medium"},
-    "hard": {"depth": 5, "name": "Hard"}
+    "medium": {"depth": 3, "book": True, "tablebase": True, "name": "Medium"},
+    "hard": {"depth": 20, "movetime": 5.0, "nodes": None, "quiescence_checks": False,
+             "ponder": True, "book": True, "tablebase": True, "name": "Hard"}
 }
\ No newline at end of file
@@ -0,0 +1,101 @@
+import argparse
+import multiprocessing
+import shlex
+import sys
+import time
+from chess_engine import ChessGame, move_to_uci
+from ai import ChessAI, close_at_exit
+
+def parse_epd(line):
+    """(fen, {opcode: [operands]}) for an EPD line, or None if it holds no position.
+    Plain FEN lines are accepted too; hmvc/fmvn operations fill in the move counters."""
+    fields = line.split(None, 6)
+    if len(fields) < 4 or line.lstrip().startswith('#'):
+        return None
+    if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+        counters = fields[4:6]
+        rest = fields[6] if len(fields) > 6 else ""
+    else:
+        counters = None
+        rest = ' '.join(fields[4:])
+    operations = {}
+    for operation in rest.split(';'):
+        parts = shlex.split(operation)
+        if parts:
+            operations[parts[0]] = parts[1:]
+    if counters is None:
+        counters = [operations.get("hmvc", ["0"])[0], operations.get("fmvn", ["1"])[0]]
+    return ' '.join(fields[:4] + counters), operations
+
+def read_epd(path):
+    """Every (fen, operations) in an EPD or FEN file"""
+    with open(path) as f:
+        return [entry for entry in map(parse_epd, f) if entry]
+
+# Each pool process keeps one ChessAI and clears it before every position. The
+# pool already uses the cores, so the engine searches in a single process.
+_ai = None
+
+def solve(job):
+    """Search one position; returns (index, name, move, solved, depth, nodes, seconds)"""
+    global _ai
+    index, fen, operations, difficulty, movetime = job
+    if _ai is None or _ai.difficulty != difficulty:
+        if _ai is not None:
+            _ai.close()
+        _ai = ChessAI(difficulty, threads=1)
+        close_at_exit(_ai)
+    _ai.new_game()
+    game = ChessGame()
+    game.load_fen(fen)
+    game.white_time = game.black_time = float("inf")  # Only the time budget applies
+    best = set()
+    avoid = set()
+    for opcode, moves in (("bm", best), ("am", avoid)):
+        for san in operations.get(opcode, []):
+            try:
+                moves.add(game.parse_san(san))
+            except ValueError:
+                pass
+    start = time.perf_counter()
+    move = _ai.find_best_move(game, movetime=movetime)
+    elapsed = time.perf_counter() - start
+    solved = (move in best or "bm" not in operations) and move not in avoid
+    name = ' '.join(operations.get("id", [])) or str(index + 1)
+    return (index, name, move_to_uci(move) if move is not None else "none", solved,
+            _ai.completed_depth, _ai.nodes, elapsed)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an EPD test suite (bm/am) against the AI")
+    parser.add_argument("suite", help="EPD file")
+    parser.add_argument("--movetime", type=float, default=1.0, help="seconds per position (default 1)")
+    parser.add_argument("--difficulty", default="hard", help="AI difficulty (default hard)")
+    parser.add_argument("--workers", type=int, help="positions searched at once (default: all cores)")
+    args = parser.parse_args(argv)
+
+    positions = read_epd(args.suite)
+    jobs = [(i, fen, operations, args.difficulty, args.movetime)
+            for i, (fen, operations) in enumerate(positions)]
+    solved_count = total_depth = total_nodes = 0
+    total_time = 0.0
+    with multiprocessing.Pool(args.workers) as pool:
+        for index, name, move, solved, depth, nodes, elapsed in pool.imap_unordered(solve, jobs):
+            solved_count += solved
+            total_depth += depth
+            total_nodes += nodes
+            total_time += elapsed
+            nps = nodes / elapsed if elapsed > 0 else 0
+            print(f"{name:<16} {'solved' if solved else 'failed'}  {move:<6} depth {depth:>2}  "
+                  f"{nodes:>9} nodes  {nps:>8.0f} nps")
+        pool.close()
+        pool.join()
+
+    n = len(jobs)
+    if n:
+        print(f"\nsolved {solved_count}/{n} ({100 * solved_count / n:.1f}%)")
+        print(f"average depth {total_depth / n:.1f}")
+        print(f"{total_nodes / total_time if total_time > 0 else 0:.0f} nps")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
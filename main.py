@@ -1,12 +1,67 @@
 import pygame
 import sys
 from chess_engine import ChessGame
-from ai import ChessAI
+from ai import AIWorker
+from chess_engine import decode_move
 from constants import *
 
+# Fonts, piece images and the pre-rendered board, loaded by load_assets() once
+# pygame is initialised
+FONT_LARGE = FONT_MEDIUM = FONT_SMALL = None
+PIECE_IMAGES = {}
+BOARD_IMAGE = None  # Squares and coordinates, blitted from instead of redrawn
+OVERLAYS = {}  # Translucent square highlights by name
+
+def load_assets():
+    global FONT_LARGE, FONT_MEDIUM, FONT_SMALL, BOARD_IMAGE
+    FONT_LARGE = pygame.font.SysFont('Arial', 36)
+    FONT_MEDIUM = pygame.font.SysFont('Arial', 24)
+    FONT_SMALL = pygame.font.SysFont('Arial', 18)
+    for color in ['w', 'b']:
+        for piece in ['p', 'r', 'n', 'b', 'q', 'k']:
+            key = f"{color}{piece}"
+            try:
+                img = pygame.image.load(f"assets/pieces/{key}.png")
+                PIECE_IMAGES[key] = pygame.transform.smoothscale(img, (SQUARE_SIZE, SQUARE_SIZE))
+            except:
+                # Fallback if image not found
+                surf = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
+                pygame.draw.circle(surf, (200, 0, 0) if color == 'w' else (0, 0, 200), 
+                                 (SQUARE_SIZE//2, SQUARE_SIZE//2), SQUARE_SIZE//3)
+                PIECE_IMAGES[key] = surf
+    BOARD_IMAGE = render_board()
+    for name, color in (("selected", HIGHLIGHT_COLOR), ("move", MOVE_COLOR), ("check", CHECK_COLOR)):
+        overlay = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
+        overlay.fill(color)
+        OVERLAYS[name] = overlay
+
+def render_board():
+    board = pygame.Surface((BOARD_SIZE, BOARD_SIZE))
+    # Draw board squares
+    for row in range(8):
+        for col in range(8):
+            color = LIGHT_SQUARE if (row + col) % 2 == 0 else DARK_SQUARE
+            pygame.draw.rect(board, color,
+                             pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+    
+    # Draw coordinates
+    font = pygame.font.SysFont('Arial', 14)
+    for i in range(8):
+        # Column letters (a-h)
+        letter = chr(ord('a') + i)
+        text = font.render(letter, True, TEXT_COLOR)
+        board.blit(text, (i * SQUARE_SIZE + SQUARE_SIZE - 15, BOARD_SIZE - 15))
+        
+        # Row numbers (1-8)
+        number = str(8 - i)
+        text = font.render(number, True, TEXT_COLOR)
+        board.blit(text, (5, i * SQUARE_SIZE + 5))
+    return board
+
 class ChessGUI:
     def __init__(self):
         pygame.init()
+        load_assets()
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         pygame.display.set_caption("Chess Game")
         self.clock = pygame.time.Clock()
@@ -27,19 +82,47 @@ class ChessGUI:
         self.ai_difficulty = "medium"
         self.show_menu = True
         
+        # AI moves are searched in a background process and picked up in update()
+        self.ai_worker = AIWorker()
+        
+        # Rendering caches: text surfaces by (font, text), and what is on screen
+        # now, so draw() only repaints and updates the parts that changed
+        self.text_cache = {}
+        self.invalidate()
+        
     def run(self):
         while self.running:
-            self.handle_events()
+            # Nothing moves but the clocks, so sleep until input arrives or the
+            # clock display may need a refresh
+            events = [pygame.event.wait(IDLE_WAIT_MS)] if self.is_idle() else []
+            self.handle_events(events)
             self.update()
             self.draw()
             self.clock.tick(FPS)
+        self.ai_worker.close()
         pygame.quit()
         sys.exit()
     
-    def handle_events(self):
-        for event in pygame.event.get():
+    def is_idle(self):
+        if self.show_menu or self.promotion_active:
+            return True
+        if self.game.animation:
+            return False
+        # A search in progress is polled every frame
+        return self.game.checkmate or self.game.stalemate or not self.ai_to_move()
+    
+    def ai_to_move(self):
+        return ((self.game_mode == "human_vs_ai" and not self.game.white_to_move) or
+                (self.game_mode == "ai_vs_ai" and not self.game.promotion_choice))
+    
+    def handle_events(self, events=()):
+        for event in list(events) + pygame.event.get():
+            if event.type == pygame.NOEVENT:
+                continue
             if event.type == pygame.QUIT:
                 self.running = False
+            elif event.type == pygame.VIDEOEXPOSE:
+                self.invalidate()
             
             if self.show_menu:
                 self.handle_menu_events(event)
@@ -68,13 +151,23 @@ class ChessGUI:
             
         return lines
     
+    def text(self, font, text):
+        """Rendered text, cached so unchanged labels are not rendered again"""
+        key = (font, text)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            if len(self.text_cache) >= TEXT_CACHE_SIZE:
+                self.text_cache.clear()
+            surface = self.text_cache[key] = font.render(text, True, TEXT_COLOR)
+        return surface
+    
     def draw_ui(self):
         # Side panel background
         pygame.draw.rect(self.screen, (240, 240, 240), self.side_panel_rect)
         pygame.draw.rect(self.screen, (200, 200, 200), self.side_panel_rect, 2)
         
         # Game status
-        status_text = FONT_MEDIUM.render(self.game.game_status, True, TEXT_COLOR)
+        status_text = self.text(FONT_MEDIUM, self.game.game_status)
         self.screen.blit(status_text, (
             self.side_panel_rect.left + 10,
             self.side_panel_rect.top + 20
@@ -84,8 +177,8 @@ class ChessGUI:
         white_time = self.game.format_time(self.game.white_time)
         black_time = self.game.format_time(self.game.black_time)
         
-        white_text = FONT_MEDIUM.render(f"White: {white_time}", True, TEXT_COLOR)
-        black_text = FONT_MEDIUM.render(f"Black: {black_time}", True, TEXT_COLOR)
+        white_text = self.text(FONT_MEDIUM, f"White: {white_time}")
+        black_text = self.text(FONT_MEDIUM, f"Black: {black_time}")
         
         self.screen.blit(white_text, (
             self.side_panel_rect.left + 10,
@@ -97,27 +190,27 @@ class ChessGUI:
         ))
         
         # Move history
-        history_title = FONT_SMALL.render("Move History:", True, TEXT_COLOR)
+        history_title = self.text(FONT_SMALL, "Move History:")
         self.screen.blit(history_title, (
             self.side_panel_rect.left + 10,
             self.side_panel_rect.top + 150
         ))
         
         for i, move in enumerate(self.game.move_history[-10:]):  # Show last 10 moves
-            move_text = FONT_SMALL.render(move, True, TEXT_COLOR)
+            move_text = self.text(FONT_SMALL, move)
             self.screen.blit(move_text, (
                 self.side_panel_rect.left + 10,
                 self.side_panel_rect.top + 180 + i * 25
             ))
         
         # Controls hint
-        controls = FONT_SMALL.render("ESC: Menu", True, TEXT_COLOR)
+        controls = self.text(FONT_SMALL, "ESC: Menu")
         self.screen.blit(controls, (
             self.side_panel_rect.left + 10,
             self.side_panel_rect.bottom - 40
         ))
         
-        controls = FONT_SMALL.render("Ctrl+Z: Undo", True, TEXT_COLOR)
+        controls = self.text(FONT_SMALL, "Ctrl+Z: Undo")
         self.screen.blit(controls, (
             self.side_panel_rect.left + 10,
             self.side_panel_rect.bottom - 20
@@ -155,6 +248,7 @@ class ChessGUI:
             # Start game button
             start_button = pygame.Rect(WIDTH//2 - 100, 500, 200, 50)
             if start_button.collidepoint(mouse_pos):
+                self.ai_worker.new_game()
                 self.game = ChessGame(self.game_mode, self.ai_difficulty)
                 self.show_menu = False
     
@@ -185,11 +279,6 @@ class ChessGUI:
                     self.promotion_active = False
                     self.selected = None
                     self.valid_moves = []
-                    
-                    # AI move if needed
-                    if ((self.game_mode == "human_vs_ai" and not self.game.white_to_move) or 
-                        (self.game_mode == "ai_vs_ai")):
-                        self.game.make_ai_move()
     
     def handle_game_events(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
@@ -213,11 +302,6 @@ class ChessGUI:
                         else:
                             self.selected = None
                             self.valid_moves = []
-                            
-                            # AI move if needed
-                            if ((self.game_mode == "human_vs_ai" and not self.game.white_to_move) or 
-                                (self.game_mode == "ai_vs_ai")):
-                                self.game.make_ai_move()
                     # Select a new piece
                     else:
                         piece = self.game.board[board_pos[0]][board_pos[1]]
@@ -233,18 +317,30 @@ class ChessGUI:
         
         elif event.type == pygame.KEYDOWN:
             if event.key == pygame.K_z and pygame.key.get_mods() & pygame.KMOD_CTRL:
+                self.ai_worker.cancel()
                 self.game.undo_move()
                 self.selected = None
                 self.valid_moves = []
             elif event.key == pygame.K_ESCAPE:
+                self.ai_worker.cancel()
                 self.show_menu = True
     
     def update(self):
         if not self.show_menu and not self.promotion_active:
-            # Handle AI moves
-            if ((self.game_mode == "human_vs_ai" and not self.game.white_to_move) or 
-                (self.game_mode == "ai_vs_ai" and not self.game.promotion_choice)):
-                self.game.make_ai_move()
+            # Handle AI moves: start a search on the AI's turn, then poll for the result
+            if self.ai_to_move():
+                if ((not self.ai_worker.pending or self.ai_worker.pondering) and
+                        not self.game.checkmate and not self.game.stalemate):
+                    self.ai_worker.request(self.game, self.ai_difficulty)
+                move = self.ai_worker.poll()
+                if move is not None:
+                    start, end, special, promotion = decode_move(move)
+                    self.game.move_piece(start, end, promotion)
+                    # Think about the expected reply while the human does
+                    if (self.game_mode == "human_vs_ai" and self.ai_worker.reply is not None and
+                            AI_DIFFICULTIES[self.ai_difficulty].get("ponder") and
+                            not self.game.checkmate and not self.game.stalemate):
+                        self.ai_worker.ponder(self.game, self.ai_worker.reply, self.ai_difficulty)
             
             # Update animation
             self.game.update_animation()
@@ -253,29 +349,51 @@ class ChessGUI:
             if not self.game.checkmate and not self.game.stalemate:
                 self.game.update_timers()
     
+    def invalidate(self):
+        """Forget what is on screen, so the next draw() repaints everything"""
+        self.drawn_menu = None
+        self.drawn_squares = {}
+        self.drawn_animation = None
+        self.drawn_promotion = None
+        self.drawn_panel = None
+    
     def draw(self):
-        self.screen.fill(UI_BG)
-        
         if self.show_menu:
-            self.draw_menu()
-        else:
-            self.draw_board()
-            self.draw_pieces()
-            self.draw_highlights()
+            menu = (self.game_mode, self.ai_difficulty)
+            if menu != self.drawn_menu:
+                self.screen.fill(UI_BG)
+                self.draw_menu()
+                pygame.display.flip()
+                self.invalidate()
+                self.drawn_menu = menu
+            return
+        
+        rects = []
+        if self.drawn_menu is not None or not self.drawn_squares:
+            # Coming from the menu, or after an expose: start from a clean screen
+            self.screen.fill(UI_BG)
+            rects.append(self.screen.get_rect())
+            self.invalidate()
+        
+        rects += self.draw_board()
+        
+        panel = (self.game.game_status, self.game.format_time(self.game.white_time),
+                 self.game.format_time(self.game.black_time), tuple(self.game.move_history[-10:]))
+        if panel != self.drawn_panel:
             self.draw_ui()
-            
-            if self.promotion_active:
-                self.draw_promotion_menu()
+            rects.append(self.side_panel_rect)
+            self.drawn_panel = panel
         
-        pygame.display.flip()
+        if rects:
+            pygame.display.update(rects)
     
     def draw_menu(self):
         # Title
-        title = FONT_LARGE.render("Chess Game", True, TEXT_COLOR)
+        title = self.text(FONT_LARGE, "Chess Game")
         self.screen.blit(title, (WIDTH//2 - title.get_width()//2, 100))
         
         # Game mode selection
-        mode_title = FONT_MEDIUM.render("Select Game Mode:", True, TEXT_COLOR)
+        mode_title = self.text(FONT_MEDIUM, "Select Game Mode:")
         self.screen.blit(mode_title, (WIDTH//2 - mode_title.get_width()//2, 160))
         
         mode_button_height = 50
@@ -290,7 +408,7 @@ class ChessGUI:
             pygame.draw.rect(self.screen, color, button_rect, border_radius=5)
             pygame.draw.rect(self.screen, (150, 150, 150), button_rect, 2, border_radius=5)
             
-            text = FONT_MEDIUM.render(name, True, TEXT_COLOR)
+            text = self.text(FONT_MEDIUM, name)
             self.screen.blit(text, (
                 button_rect.centerx - text.get_width()//2,
                 button_rect.centery - text.get_height()//2
@@ -298,7 +416,7 @@ class ChessGUI:
         
         # Difficulty selection (only for AI modes)
         if self.game_mode != "human_vs_human":
-            diff_title = FONT_MEDIUM.render("Select AI Difficulty:", True, TEXT_COLOR)
+            diff_title = self.text(FONT_MEDIUM, "Select AI Difficulty:")
             self.screen.blit(diff_title, (WIDTH//2 - diff_title.get_width()//2, 310))
             
             diff_button_height = 40
@@ -313,7 +431,7 @@ class ChessGUI:
                 pygame.draw.rect(self.screen, color, button_rect, border_radius=5)
                 pygame.draw.rect(self.screen, (150, 150, 150), button_rect, 2, border_radius=5)
                 
-                text = FONT_SMALL.render(info["name"], True, TEXT_COLOR)
+                text = self.text(FONT_SMALL, info["name"])
                 self.screen.blit(text, (
                     button_rect.centerx - text.get_width()//2,
                     button_rect.centery - text.get_height()//2
@@ -324,111 +442,105 @@ class ChessGUI:
         pygame.draw.rect(self.screen, (150, 255, 150), start_button, border_radius=5)
         pygame.draw.rect(self.screen, (0, 100, 0), start_button, 2, border_radius=5)
         
-        start_text = FONT_MEDIUM.render("Start Game", True, TEXT_COLOR)
+        start_text = self.text(FONT_MEDIUM, "Start Game")
         self.screen.blit(start_text, (
             start_button.centerx - start_text.get_width()//2,
             start_button.centery - start_text.get_height()//2
         ))
     
     def draw_board(self):
-        # Draw board squares
-        for row in range(8):
-            for col in range(8):
-                color = LIGHT_SQUARE if (row + col) % 2 == 0 else DARK_SQUARE
-                pygame.draw.rect(
-                    self.screen, 
-                    color, 
-                    pygame.Rect(
-                        self.board_rect.left + col * SQUARE_SIZE,
-                        self.board_rect.top + row * SQUARE_SIZE,
-                        SQUARE_SIZE,
-                        SQUARE_SIZE
-                    )
-                )
+        """Repaint the squares whose piece or highlight changed, and those the
+        animated piece covers now or covered last frame; returns the screen
+        rectangles that changed"""
+        squares = self.square_contents()
+        animation = self.animation_position()
+        if self.promotion_active != self.drawn_promotion:
+            dirty = set(squares)
+            self.drawn_promotion = self.promotion_active
+        else:
+            dirty = {square for square, contents in squares.items()
+                     if self.drawn_squares.get(square) != contents}
+            if animation != self.drawn_animation:
+                for position in (self.drawn_animation, animation):
+                    if position:
+                        dirty.update(self.covered_squares(position))
+        if not dirty:
+            return []
+        if animation:
+            # Blitting the animated piece again over squares that were not
+            # repainted would darken its edges
+            dirty.update(self.covered_squares(animation))
         
-        # Draw coordinates
-        font = pygame.font.SysFont('Arial', 14)
-        for i in range(8):
-            # Column letters (a-h)
-            letter = chr(ord('a') + i)
-            text = font.render(letter, True, TEXT_COLOR)
-            self.screen.blit(text, (
-                self.board_rect.left + i * SQUARE_SIZE + SQUARE_SIZE - 15,
-                self.board_rect.bottom - 15
-            ))
-            
-            # Row numbers (1-8)
-            number = str(8 - i)
-            text = font.render(number, True, TEXT_COLOR)
-            self.screen.blit(text, (
-                self.board_rect.left + 5,
-                self.board_rect.top + i * SQUARE_SIZE + 5
-            ))
+        rects = []
+        for row, col in dirty:
+            rect = self.square_rect(row, col)
+            self.screen.blit(BOARD_IMAGE, rect, rect.move(-self.board_rect.left, -self.board_rect.top))
+            piece = squares[row, col][0]
+            if piece != "--":
+                self.screen.blit(PIECE_IMAGES[piece], rect)
+            rects.append(rect)
+        
+        # The animated piece goes under the highlights, inside the repainted squares
+        if animation:
+            self.screen.set_clip(self.board_rect)
+            self.screen.blit(PIECE_IMAGES[self.game.animation["piece"]], animation)
+            self.screen.set_clip(None)
+        
+        for row, col in dirty:
+            piece, selected, move, check = squares[row, col]
+            for name, shown in (("selected", selected), ("move", move), ("check", check)):
+                if shown:
+                    self.screen.blit(OVERLAYS[name], self.square_rect(row, col))
+        
+        if self.promotion_active:
+            rects.append(self.draw_promotion_menu())
+        
+        self.drawn_squares = squares
+        self.drawn_animation = animation
+        return rects
+    
+    def square_rect(self, row, col):
+        return pygame.Rect(self.board_rect.left + col * SQUARE_SIZE,
+                           self.board_rect.top + row * SQUARE_SIZE,
+                           SQUARE_SIZE, SQUARE_SIZE)
     
-    def draw_pieces(self):
-        # Draw pieces
+    def square_contents(self):
+        """(piece, selected, valid move, king in check) for every square"""
+        targets = {move[:2] for move in self.valid_moves}
+        check = self.check_square()
+        animation_start = self.game.animation["start"] if self.game.animation else None
+        contents = {}
         for row in range(8):
             for col in range(8):
-                piece = self.game.board[row][col]
-                if piece != "--":
-                    # Don't draw the piece being animated
-                    if self.game.animation and (row, col) == self.game.animation["start"]:
-                        continue
-                    
-                    self.screen.blit(
-                        PIECE_IMAGES[piece],
-                        pygame.Rect(
-                            self.board_rect.left + col * SQUARE_SIZE,
-                            self.board_rect.top + row * SQUARE_SIZE,
-                            SQUARE_SIZE,
-                            SQUARE_SIZE
-                        )
-                    )
-        
-        # Draw animated piece
-        if self.game.animation:
-            progress = self.game.animation["progress"] / 100
-            sr, sc = self.game.animation["start"]
-            er, ec = self.game.animation["end"]
-            
-            x = self.board_rect.left + sc * SQUARE_SIZE + (ec - sc) * SQUARE_SIZE * progress
-            y = self.board_rect.top + sr * SQUARE_SIZE + (er - sr) * SQUARE_SIZE * progress
-            
-            self.screen.blit(PIECE_IMAGES[self.game.animation["piece"]], (x, y))
+                square = (row, col)
+                # Don't draw the piece being animated
+                piece = "--" if square == animation_start else self.game.board[row][col]
+                contents[square] = (piece, square == self.selected, square in targets, square == check)
+        return contents
     
-    def draw_highlights(self):
-        # Highlight selected piece
-        if self.selected:
-            row, col = self.selected
-            highlight = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-            highlight.fill(HIGHLIGHT_COLOR)
-            self.screen.blit(
-                highlight,
-                (self.board_rect.left + col * SQUARE_SIZE, 
-                 self.board_rect.top + row * SQUARE_SIZE)
-            )
-        
-        # Highlight valid moves
-        for move in self.valid_moves:
-            row, col = move[:2]
-            move_highlight = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-            move_highlight.fill(MOVE_COLOR)
-            self.screen.blit(
-                move_highlight,
-                (self.board_rect.left + col * SQUARE_SIZE, 
-                 self.board_rect.top + row * SQUARE_SIZE)
-            )
+    def check_square(self):
+        """The square of the side to move's king if it is in check"""
+        if not self.game.position_info()["in_check"]:
+            return None
+        return self.game.white_king_pos if self.game.white_to_move else self.game.black_king_pos
+    
+    def animation_position(self):
+        """Top left corner of the animated piece on screen, or None"""
+        if not self.game.animation:
+            return None
+        progress = self.game.animation["progress"] / 100
+        sr, sc = self.game.animation["start"]
+        er, ec = self.game.animation["end"]
         
-        # Highlight king in check
-        king_pos = self.game.white_king_pos if self.game.white_to_move else self.game.black_king_pos
-        if self.game.is_in_check():
-            check_highlight = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-            check_highlight.fill(CHECK_COLOR)
-            self.screen.blit(
-                check_highlight,
-                (self.board_rect.left + king_pos[1] * SQUARE_SIZE,
-                 self.board_rect.top + king_pos[0] * SQUARE_SIZE)
-            )
+        x = self.board_rect.left + sc * SQUARE_SIZE + (ec - sc) * SQUARE_SIZE * progress
+        y = self.board_rect.top + sr * SQUARE_SIZE + (er - sr) * SQUARE_SIZE * progress
+        return (int(x), int(y))
+    
+    def covered_squares(self, position):
+        x, y = position[0] - self.board_rect.left, position[1] - self.board_rect.top
+        rows = range(max(0, y // SQUARE_SIZE), min(8, (y + SQUARE_SIZE - 1) // SQUARE_SIZE + 1))
+        cols = range(max(0, x // SQUARE_SIZE), min(8, (x + SQUARE_SIZE - 1) // SQUARE_SIZE + 1))
+        return [(row, col) for row in rows for col in cols]
     
     def draw_promotion_menu(self):
         promotion_pieces = ['q', 'r', 'b', 'n']
@@ -466,6 +578,7 @@ class ChessGUI:
                 PIECE_IMAGES[f"{color}{piece}"],
                 piece_rect
             )
+        return pygame.Rect(promotion_x, promotion_y, SQUARE_SIZE, 4 * SQUARE_SIZE)
 
 if __name__ == "__main__":
     gui = ChessGUI()
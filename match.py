@@ -0,0 +1,223 @@
+import argparse
+import math
+import multiprocessing
+import sys
+import time
+from chess_engine import ChessGame
+from ai import ChessAI, close_at_exit
+from constants import AI_DIFFICULTIES
+from epd import read_epd
+
+# Balanced positions a few moves into common openings. Each is played twice,
+# once with each engine as White.
+OPENINGS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",  # Open game
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2",  # Sicilian
+    "rnbqkbnr/pppp1ppp/4p3/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",  # French
+    "rnbqkbnr/pp1ppppp/2p5/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",  # Caro-Kann
+    "rnbqkbnr/ppp1pppp/8/3p4/2PP4/8/PP2PPPP/RNBQKBNR b KQkq c3 0 2",  # Queen's Gambit
+    "rnbqkb1r/pppppp1p/5np1/8/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3",  # King's Indian
+    "rnbqkb1r/pppp1ppp/4pn2/8/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3",  # Nimzo/Queen's Indian
+    "rnbqkbnr/pppppppp/8/8/2P5/8/PP1PPPPP/RNBQKBNR b KQkq c3 0 1",  # English
+    "rnbqkbnr/ppppp1pp/8/5p2/3P4/8/PPP1PPPP/RNBQKBNR w KQkq f6 0 2",  # Dutch
+    "r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3",  # Ruy Lopez
+    "rnbqkbnr/ppp1pppp/8/3p4/3P4/5N2/PPP1PPPP/RNBQKB1R b KQkq - 1 2"  # Queen's pawn
+]
+
+# Settings an engine spec can override, e.g. "hard:depth=4,quiescence_checks=1"
+ENGINE_OPTIONS = {"depth": ("depth", int), "movetime": ("movetime", float),
+                  "nodes": ("max_nodes", int), "quiescence_checks": ("quiescence_checks", int),
+                  "hash": ("hash_mb", int)}
+
+def parse_engine(spec):
+    """Split an engine spec into (difficulty, {attribute: value})"""
+    difficulty, _, options = spec.partition(':')
+    if difficulty not in AI_DIFFICULTIES:
+        raise ValueError(f"Unknown difficulty {difficulty!r}")
+    overrides = {}
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        if key not in ENGINE_OPTIONS:
+            raise ValueError(f"Unknown engine option {key!r}")
+        attribute, kind = ENGINE_OPTIONS[key]
+        overrides[attribute] = kind(value)
+    return difficulty, overrides
+
+# Each pool process keeps one ChessAI per engine spec and clears it between games.
+# The pool already uses the cores, so every engine searches in a single process.
+_engines = {}
+
+def _engine(slot, spec):
+    key = (slot, spec)
+    if key not in _engines:
+        difficulty, overrides = parse_engine(spec)
+        hash_mb = overrides.pop("hash_mb", None)
+        ai = ChessAI(difficulty, hash_mb, threads=1) if hash_mb else ChessAI(difficulty, threads=1)
+        close_at_exit(ai)
+        for attribute, value in overrides.items():
+            setattr(ai, attribute, bool(value) if attribute == "quiescence_checks" else value)
+        _engines[key] = ai
+    ai = _engines[key]
+    ai.new_game()
+    return ai
+
+def insufficient_material(game):
+    """Only kings, or kings and a single knight or bishop"""
+    minors = 0
+    for row in game.board:
+        for piece in row:
+            if piece == "--" or piece[1] == 'k':
+                continue
+            if piece[1] in "pqr":
+                return False
+            minors += 1
+    return minors <= 1
+
+def play_game(job):
+    """Play one game; returns (index, result for the first engine, plies, reason)"""
+    index, fen, specs, first_is_white, depth, movetime, nodes, max_plies = job
+    game = ChessGame()
+    game.load_fen(fen)
+    game.white_time = game.black_time = float("inf")  # Only the per-move limits apply
+    white = _engine(0 if first_is_white else 1, specs[0 if first_is_white else 1])
+    black = _engine(1 if first_is_white else 0, specs[1 if first_is_white else 0])
+    seen = {game.zobrist_key: 1}
+    plies = 0
+    while True:
+        if not game.generate_legal_moves():
+            if game.is_in_check():
+                white_score, reason = (0 if game.white_to_move else 1), "checkmate"
+            else:
+                white_score, reason = 0.5, "stalemate"
+            break
+        if seen[game.zobrist_key] >= 3:
+            white_score, reason = 0.5, "repetition"
+            break
+        if game.halfmove_clock >= 100:
+            white_score, reason = 0.5, "fifty moves"
+            break
+        if insufficient_material(game):
+            white_score, reason = 0.5, "insufficient material"
+            break
+        if plies >= max_plies:
+            white_score, reason = 0.5, "adjudicated"
+            break
+        ai = white if game.white_to_move else black
+        move = ai.find_best_move(game, depth, movetime, nodes)
+        game.make_move(move)
+        seen[game.zobrist_key] = seen.get(game.zobrist_key, 0) + 1
+        plies += 1
+    return index, white_score if first_is_white else 1 - white_score, plies, reason
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+def elo_from_score(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+def score_stats(wins, draws, losses):
+    """(mean score, variance of one game's score)"""
+    n = wins + draws + losses
+    score = (wins + draws / 2) / n
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / n
+    return score, variance
+
+def smoothed(wins, draws, losses):
+    """Add half a game of each result when one is missing, which keeps the
+    variance above zero in short, one-sided runs"""
+    if not (wins and draws and losses):
+        return wins + 0.5, draws + 0.5, losses + 0.5
+    return wins, draws, losses
+
+def elo_interval(wins, draws, losses):
+    """Elo difference with a 95% confidence interval, as (elo, low, high). The
+    interval comes from the smoothed counts, so it never collapses to a point."""
+    score = (wins + draws / 2) / (wins + draws + losses)
+    wins, draws, losses = smoothed(wins, draws, losses)
+    n = wins + draws + losses
+    _, variance = score_stats(wins, draws, losses)
+    margin = 1.96 * math.sqrt(variance / n)
+    return elo_from_score(score), elo_from_score(score - margin), elo_from_score(score + margin)
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    """Log-likelihood ratio of H1 (elo1) against H0 (elo0), using the normal
+    approximation of the game score"""
+    wins, draws, losses = smoothed(wins, draws, losses)
+    n = wins + draws + losses
+    score, variance = score_stats(wins, draws, losses)
+    s0, s1 = expected_score(elo0), expected_score(elo1)
+    return n * (s1 - s0) * (2 * score - s0 - s1) / (2 * variance)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play two AI configurations against each other without a display")
+    parser.add_argument("engine1", help="engine spec, e.g. hard or hard:depth=4,quiescence_checks=1")
+    parser.add_argument("engine2", help="engine spec to compare against")
+    parser.add_argument("--games", type=int, default=1000, help="maximum number of games (default 1000)")
+    parser.add_argument("--openings", help="file of FEN/EPD start positions (default: built-in list)")
+    parser.add_argument("--movetime", type=float, help="seconds per move")
+    parser.add_argument("--nodes", type=int, help="nodes per move")
+    parser.add_argument("--depth", type=int, help="maximum depth per move")
+    parser.add_argument("--max-plies", type=int, default=400, help="adjudicate a draw after this many plies")
+    parser.add_argument("--workers", type=int, help="games played at once (default: all cores)")
+    parser.add_argument("--elo0", type=float, default=0.0, help="SPRT null hypothesis Elo (default 0)")
+    parser.add_argument("--elo1", type=float, default=5.0, help="SPRT alternative hypothesis Elo (default 5)")
+    parser.add_argument("--alpha", type=float, default=0.05, help="SPRT false positive rate")
+    parser.add_argument("--beta", type=float, default=0.05, help="SPRT false negative rate")
+    args = parser.parse_args(argv)
+
+    specs = (args.engine1, args.engine2)
+    for spec in specs:
+        parse_engine(spec)
+    if args.movetime is None and args.nodes is None and args.depth is None:
+        args.movetime = 0.1
+    openings = [fen for fen, operations in read_epd(args.openings)] if args.openings else OPENINGS
+    jobs = [(i, openings[i // 2 % len(openings)], specs, i % 2 == 0,
+             args.depth, args.movetime, args.nodes, args.max_plies)
+            for i in range(args.games)]
+    lower = math.log(args.beta / (1 - args.alpha))
+    upper = math.log((1 - args.beta) / args.alpha)
+
+    wins = draws = losses = 0
+    verdict = None
+    start = time.perf_counter()
+    print(f"{args.engine1} vs {args.engine2}: up to {args.games} games, "
+          f"SPRT elo0={args.elo0} elo1={args.elo1} bounds [{lower:.2f}, {upper:.2f}]")
+    with multiprocessing.Pool(args.workers) as pool:
+        for index, score, plies, reason in pool.imap_unordered(play_game, jobs):
+            if score == 1:
+                wins += 1
+            elif score == 0:
+                losses += 1
+            else:
+                draws += 1
+            n = wins + draws + losses
+            elo, low, high = elo_interval(wins, draws, losses)
+            llr = sprt_llr(wins, draws, losses, args.elo0, args.elo1)
+            minutes = (time.perf_counter() - start) / 60
+            print(f"game {index + 1:>5} {['loss', 'draw', 'win '][int(score * 2)]} ({reason}, {plies} plies)  "
+                  f"+{wins} ={draws} -{losses}  elo {elo:+.1f} [{low:+.1f}, {high:+.1f}]  "
+                  f"LLR {llr:+.2f}  {n / minutes:.1f} games/min")
+            if llr >= upper:
+                verdict = "H1 accepted: engine1 is stronger by at least elo1"
+            elif llr <= lower:
+                verdict = "H0 accepted: engine1 is not stronger by elo1"
+            if verdict:
+                pool.terminate()  # Games still running are abandoned
+                break
+        else:
+            pool.close()
+            pool.join()
+
+    n = wins + draws + losses
+    elo, low, high = elo_interval(wins, draws, losses)
+    minutes = (time.perf_counter() - start) / 60
+    print(f"\n{n} games: +{wins} ={draws} -{losses}, score {(wins + draws / 2) / n:.3f}")
+    print(f"Elo difference {elo:+.1f} (95% [{low:+.1f}, {high:+.1f}])")
+    print(f"SPRT: {verdict or 'inconclusive'}, LLR {sprt_llr(wins, draws, losses, args.elo0, args.elo1):+.2f}")
+    print(f"{n / minutes:.1f} games/min")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import argparse
+import sys
+import time
+from chess_engine import ChessGame
+
+# Reference positions with known perft node counts for depths 1, 2, 3, ...
+REFERENCE_POSITIONS = {
+    "startpos": (
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        [20, 400, 8902, 197281, 4865609]
+    ),
+    "kiwipete": (
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        [48, 2039, 97862, 4085603]
+    ),
+    # En passant discovered checks and pins along the rank
+    "enpassant": (
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        [14, 191, 2812, 43238, 674624]
+    ),
+    # Promotions, underpromotions and castling through attacked squares
+    "promotion": (
+        "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        [6, 264, 9467, 422333]
+    ),
+    "castling": (
+        "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        [44, 1486, 62379, 2103487]
+    ),
+    "middlegame": (
+        "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        [46, 2079, 89890, 3894594]
+    )
+}
+
+def run_perft(game, depth, expected=None):
+    """Run perft to each depth up to depth, printing nodes and nodes per second.
+    Returns False if any count differs from expected."""
+    ok = True
+    for d in range(1, depth + 1):
+        start = time.perf_counter()
+        nodes = game.perft(d)
+        elapsed = time.perf_counter() - start
+        nps = nodes / elapsed if elapsed > 0 else 0
+        line = f"  depth {d}: {nodes:>10} nodes  {elapsed:8.3f}s  {nps:>10.0f} nps"
+        if expected and d <= len(expected):
+            if nodes == expected[d - 1]:
+                line += "  OK"
+            else:
+                line += f"  FAIL (expected {expected[d - 1]})"
+                ok = False
+        print(line)
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft correctness and throughput check for chess_engine")
+    parser.add_argument("--depth", type=int, default=3, help="maximum depth (default 3)")
+    parser.add_argument("--position", choices=REFERENCE_POSITIONS, action="append",
+                        help="reference position to run (default: all)")
+    parser.add_argument("--fen", help="run a custom position instead of the reference set")
+    parser.add_argument("--divide", action="store_true", help="print node counts per root move")
+    parser.add_argument("--backend", choices=["bitboard", "mailbox"], default="bitboard")
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        positions = [("fen", args.fen, None)]
+    else:
+        names = args.position or list(REFERENCE_POSITIONS)
+        positions = [(name,) + REFERENCE_POSITIONS[name] for name in names]
+
+    ok = True
+    for name, fen, expected in positions:
+        game = ChessGame(backend=args.backend)
+        game.load_fen(fen)
+        print(f"{name}: {fen}")
+        if args.divide:
+            counts = game.divide(args.depth)
+            for move in sorted(counts):
+                print(f"  {move}: {counts[move]}")
+            print(f"  total: {sum(counts.values())}")
+        else:
+            ok = run_perft(game, args.depth, expected) and ok
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import argparse
+import sys
+import time
+from chess_engine import ChessGame
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+SEVEN_TAG_ROSTER = ["Event", "Site", "Date", "Round", "White", "Black", "Result"]
+TAG_DEFAULTS = {"Date": "????.??.??", "Result": "*"}  # Other missing roster tags are "?"
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+LINE_WIDTH = 80
+
+def read_pgn(source):
+    """Yield (headers, san moves) for each game in a PGN file, given as a path or an
+    open text file. Only one game is held in memory at a time."""
+    if isinstance(source, str):
+        with open(source, encoding="utf-8", errors="replace") as f:
+            yield from read_pgn(f)
+        return
+    headers, movetext = {}, []
+    in_comment = False  # A { comment } can span lines, and those lines are not tags
+    for line in source:
+        line = line.strip()
+        if line.startswith('[') and not in_comment:
+            if movetext:
+                yield headers, _san_tokens(" ".join(movetext))
+                headers, movetext = {}, []
+            name, _, value = line[1:-1].partition(' ')
+            headers[name] = value.strip('"')
+        elif line and not line.startswith('%'):
+            line, in_comment = _strip_rest_of_line_comment(line, in_comment)
+            movetext.append(line)
+    if movetext or headers:
+        yield headers, _san_tokens(" ".join(movetext))
+
+def _strip_rest_of_line_comment(line, in_comment):
+    """Cut a ; comment off the line, and tell whether a { comment } is still open at
+    its end. Comments do not nest, so braces and semicolons inside one are text."""
+    pos = 0
+    while True:
+        if in_comment:
+            end = line.find('}', pos)
+            if end < 0:
+                return line, True
+            in_comment = False
+            pos = end + 1
+        else:
+            brace = line.find('{', pos)
+            semicolon = line.find(';', pos)
+            if semicolon >= 0 and (brace < 0 or semicolon < brace):
+                return line[:semicolon], False
+            if brace < 0:
+                return line, False
+            in_comment = True
+            pos = brace + 1
+
+def _san_tokens(movetext):
+    """Mainline moves of a movetext, skipping comments, variations, NAGs and numbers"""
+    moves = []
+    depth = 0
+    in_comment = False
+    for token in movetext.replace('(', ' ( ').replace(')', ' ) ').replace('{', ' { ').replace('}', ' } ').split():
+        if in_comment:
+            in_comment = token != '}'
+        elif token == '{':
+            in_comment = True
+        elif token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth == 0 and not token.startswith('$') and token not in RESULTS:
+            token = token.split('.')[-1]  # Drop move numbers such as 12. or 12...
+            if token:
+                moves.append(token)
+    return moves
+
+def read_games(source, max_ply=None):
+    """Yield (headers, start FEN, encoded moves) for each game in a PGN file. A game's
+    moves stop at the first one that is not legal, or after max_ply half moves."""
+    game = ChessGame()
+    for headers, sans in read_pgn(source):
+        fen = headers.get("FEN", START_FEN)
+        game.load_fen(fen)
+        moves = []
+        for san in sans[:max_ply]:
+            try:
+                move = game.parse_san(san)
+            except ValueError:
+                break
+            game.make_move(move)
+            moves.append(move)
+        yield headers, fen, moves
+
+def game_record(game):
+    """(start FEN, encoded moves) for the moves played in a ChessGame"""
+    moves = [entry[0] for entry in game.state_log]
+    for _ in moves:
+        game.unmake_move()
+    fen = game.to_fen()
+    for move in moves:
+        game.make_move(move)
+    return fen, moves
+
+def game_result(game):
+    """The PGN result of the game's current position: decided only by mate or stalemate"""
+    info = game.position_info()
+    if info["moves"]:
+        return "*"
+    if info["in_check"]:
+        return "0-1" if game.white_to_move else "1-0"
+    return "1/2-1/2"
+
+def format_pgn(headers, fen, moves):
+    """PGN text for a game given its tags, start FEN and encoded moves"""
+    game = ChessGame()
+    game.load_fen(fen)
+    headers = dict(headers)
+    if fen != START_FEN:
+        headers.setdefault("SetUp", "1")
+        headers["FEN"] = fen
+    headers.setdefault("Result", "*")
+    result = headers["Result"]
+    lines = [f'[{name} "{headers.get(name, TAG_DEFAULTS.get(name, "?"))}"]' for name in SEVEN_TAG_ROSTER]
+    lines += [f'[{name} "{value}"]' for name, value in headers.items() if name not in SEVEN_TAG_ROSTER]
+    lines.append("")
+
+    # One unit per move, with its number where PGN shows one, so lines break between moves
+    units = []
+    number = int(fen.split()[5]) if len(fen.split()) > 5 else 1
+    for move in moves:
+        san = game.move_to_san(move)
+        if game.white_to_move:
+            units.append(f"{number}. {san}")
+        else:
+            units.append(f"{number}... {san}" if not units else san)
+            number += 1
+        game.make_move(move)
+    units.append(result)
+
+    line = ""
+    for unit in units:
+        if line and len(line) + 1 + len(unit) > LINE_WIDTH:
+            lines.append(line)
+            line = unit
+        else:
+            line = f"{line} {unit}" if line else unit
+    lines.append(line)
+    return "\n".join(lines) + "\n"
+
+def write_pgn(out, headers, fen, moves):
+    """Append one game to an open text file, followed by a blank line"""
+    out.write(format_pgn(headers, fen, moves) + "\n")
+
+def game_pgn(game, headers=None):
+    """PGN text for the moves played in a ChessGame; headers fill in the tags and the
+    result is taken from the final position unless given"""
+    fen, moves = game_record(game)
+    headers = dict(headers or {})
+    headers.setdefault("Result", game_result(game))
+    return format_pgn(headers, fen, moves)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read PGN files, reporting games, moves and import speed")
+    parser.add_argument("pgn", nargs="+", help="PGN files")
+    parser.add_argument("--out", help="write the games back out as clean PGN to this file")
+    args = parser.parse_args(argv)
+
+    out = open(args.out, 'w') if args.out else None
+    games = plies = 0
+    start = time.perf_counter()
+    for path in args.pgn:
+        for headers, fen, moves in read_games(path):
+            games += 1
+            plies += len(moves)
+            if out:
+                write_pgn(out, headers, fen, moves)
+    elapsed = time.perf_counter() - start
+    if out:
+        out.close()
+    print(f"{games} games, {plies} moves in {elapsed:.1f}s, "
+          f"{games / elapsed * 60 if elapsed > 0 else 0:.0f} games/min")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
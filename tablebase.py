@@ -0,0 +1,433 @@
+# Endgame tablebases for up to four pieces, built by retrograde analysis.
+# A table covers one material balance, named with white's pieces first (KRK,
+# KQKR, ...), and stores one byte per position: 0 for a draw or an impossible
+# position, otherwise 1 + the number of plies to mate with best play. An odd
+# number of plies means the side to move mates, an even number that it is mated.
+# Positions are indexed by the side to move and the square of each piece, in
+# the order white king, black king, white pieces, black pieces. Castling and
+# en passant cannot happen in these endings and are not covered.
+import argparse
+import array
+import mmap
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+from bitboard import piece_attacks
+
+PIECE_ORDER = "KQRBNP"
+DRAWN_MATERIAL = {"KK", "KBK", "KNK"}  # Neither side can mate
+THREE_PIECE = ["KQK", "KRK", "KPK"]
+FOUR_PIECE = [
+    "KQQK", "KQRK", "KQBK", "KQNK", "KQPK", "KRRK", "KRBK", "KRNK", "KRPK", "KBBK",
+    "KBNK", "KBPK", "KNNK", "KNPK", "KPPK", "KQKQ", "KQKR", "KQKB", "KQKN", "KQKP",
+    "KRKR", "KRKB", "KRKN", "KRKP", "KBKB", "KBKN", "KBKP", "KNKN", "KNKP", "KPKP"
+]
+CHECKPOINT_SECONDS = 60  # How often a build saves its progress
+
+def _strength(side):
+    return len(side), [-PIECE_ORDER.index(piece) for piece in side]
+
+def material_name(pieces):
+    """The material name for a list of pieces such as ["wk", "bk", "wr"]"""
+    white = ''.join(sorted((p[1].upper() for p in pieces if p[0] == 'w'), key=PIECE_ORDER.index))
+    black = ''.join(sorted((p[1].upper() for p in pieces if p[0] == 'b'), key=PIECE_ORDER.index))
+    return white + black
+
+def canonical(name):
+    """(name with the stronger side as white, whether the colors were swapped)"""
+    split = name.index('K', 1)
+    white, black = name[:split], name[split:]
+    if _strength(black) > _strength(white):
+        return black + white, True
+    return name, False
+
+def table_pieces(name):
+    """The pieces of a table in index order"""
+    split = name.index('K', 1)
+    white, black = name[:split], name[split:]
+    return ["wk", "bk"] + ['w' + p.lower() for p in white[1:]] + ['b' + p.lower() for p in black[1:]]
+
+def dependencies(name):
+    """Tables that positions in name can reach by a capture or a promotion"""
+    pieces = table_pieces(name)
+    needed = set()
+    for i, piece in enumerate(pieces):
+        if piece[1] == 'k':
+            continue
+        rest = pieces[:i] + pieces[i + 1:]
+        needed.add(canonical(material_name(rest))[0])
+        if piece[1] == 'p':
+            for promotion in "qrbn":
+                needed.add(canonical(material_name(rest + [piece[0] + promotion]))[0])
+    return sorted(needed - DRAWN_MATERIAL)
+
+def _encode(stm, sqs):
+    index = stm
+    for sq in sqs:
+        index = index << 6 | sq
+    return index
+
+def _decode(index, n):
+    sqs = [0] * n
+    for i in range(n - 1, -1, -1):
+        sqs[i] = index & 63
+        index >>= 6
+    return index, sqs
+
+def _attacked(sq, color, pieces, sqs, occupied, skip=-1):
+    """Whether any piece of color (other than pieces[skip]) attacks sq"""
+    for i, piece in enumerate(pieces):
+        if piece[0] == color and i != skip and piece_attacks(piece, sqs[i], occupied) >> sq & 1:
+            return True
+    return False
+
+def _valid(pieces, sqs, stm):
+    """Distinct squares, no pawn on the first or last rank, and the side that
+    just moved is not in check"""
+    occupied = 0
+    for i, sq in enumerate(sqs):
+        if occupied >> sq & 1 or (pieces[i][1] == 'p' and sq >> 3 in (0, 7)):
+            return False
+        occupied |= 1 << sq
+    waiting = 1 if stm == 0 else 0  # Index of the king of the side not to move
+    return not _attacked(sqs[waiting], "wb"[stm], pieces, sqs, occupied)
+
+def _moves(pieces, sqs, stm):
+    """Legal moves as (moving piece index, new squares, captured piece index or -1,
+    promotion or None)"""
+    color = "wb"[stm]
+    occupied = own = 0
+    for i, sq in enumerate(sqs):
+        occupied |= 1 << sq
+        if pieces[i][0] == color:
+            own |= 1 << sq
+    king = stm  # White king is piece 0, black king piece 1
+    for i, piece in enumerate(pieces):
+        if piece[0] != color:
+            continue
+        sq = sqs[i]
+        if piece[1] == 'p':
+            step = -8 if color == 'w' else 8
+            targets = piece_attacks(piece, sq, occupied) & occupied & ~own
+            if not occupied >> (sq + step) & 1:
+                targets |= 1 << (sq + step)
+                if sq >> 3 == (6 if color == 'w' else 1) and not occupied >> (sq + 2 * step) & 1:
+                    targets |= 1 << (sq + 2 * step)
+        else:
+            targets = piece_attacks(piece, sq, occupied) & ~own
+        while targets:
+            low = targets & -targets
+            target = low.bit_length() - 1
+            targets ^= low
+            captured = sqs.index(target) if occupied & low else -1
+            new_sqs = sqs[:]
+            new_sqs[i] = target
+            new_occupied = occupied ^ (1 << sq) | low
+            if _attacked(new_sqs[king], "bw"[stm], pieces, new_sqs, new_occupied, captured):
+                continue
+            if piece[1] == 'p' and target >> 3 in (0, 7):
+                for promotion in "qrbn":
+                    yield i, new_sqs, captured, color + promotion
+            else:
+                yield i, new_sqs, captured, None
+
+def _unmoves(pieces, sqs, stm):
+    """Indexes of the positions the previous move could have come from, leaving
+    out captures and promotions since those change the material"""
+    color = "bw"[stm]
+    occupied = 0
+    for sq in sqs:
+        occupied |= 1 << sq
+    for i, piece in enumerate(pieces):
+        if piece[0] != color:
+            continue
+        sq = sqs[i]
+        if piece[1] == 'p':
+            back = 8 if color == 'w' else -8
+            sources = 0
+            if 1 <= (sq + back) >> 3 <= 6 and not occupied >> (sq + back) & 1:
+                sources |= 1 << (sq + back)
+                if sq >> 3 == (4 if color == 'w' else 3) and not occupied >> (sq + 2 * back) & 1:
+                    sources |= 1 << (sq + 2 * back)
+        else:
+            sources = piece_attacks(piece, sq, occupied) & ~occupied
+        while sources:
+            low = sources & -sources
+            sources ^= low
+            new_sqs = sqs[:]
+            new_sqs[i] = low.bit_length() - 1
+            if _valid(pieces, new_sqs, 1 - stm):
+                yield _encode(1 - stm, new_sqs)
+
+class Tablebases:
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+
+    def path(self, name):
+        return os.path.join(self.directory, name + ".tb")
+
+    def table(self, name):
+        """The values of a table, mapped from disk on first use; None if not built"""
+        if name not in self.tables:
+            path = self.path(name)
+            if not os.path.exists(path):
+                return None
+            with open(path, 'rb') as f:
+                self.tables[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.tables[name]
+
+    def lookup(self, pieces, sqs, white_to_move):
+        """(result, plies) for the side to move, result being 1 for a win, 0 for a
+        draw and -1 for a loss; None if the table is not available"""
+        name, flipped = canonical(material_name(pieces))
+        if name in DRAWN_MATERIAL:
+            return 0, 0
+        values = self.table(name)
+        if values is None:
+            return None
+        if flipped:
+            pieces = [("b" if p[0] == 'w' else "w") + p[1] for p in pieces]
+            sqs = [sq ^ 56 for sq in sqs]
+            white_to_move = not white_to_move
+        # Put the pieces in table order; identical pieces can go in either order
+        remaining = list(zip(pieces, sqs))
+        ordered = []
+        for piece in table_pieces(name):
+            for j, (other, sq) in enumerate(remaining):
+                if other == piece:
+                    ordered.append(sq)
+                    del remaining[j]
+                    break
+        value = values[_encode(0 if white_to_move else 1, ordered)]
+        if not value:
+            return 0, 0
+        return (1 if (value - 1) % 2 else -1), value - 1
+
+    def probe(self, game):
+        """(result, plies) for the game's side to move, or None if the position
+        is not covered"""
+        if game.bitboards and bin(game.bitboards.occupied).count("1") > 4:
+            return None
+        if game.en_passant_possible or any(game.get_castle_tuple()):
+            return None
+        pieces, sqs = [], []
+        for r in range(8):
+            for c in range(8):
+                if game.board[r][c] != "--":
+                    pieces.append(game.board[r][c])
+                    sqs.append(r * 8 + c)
+                    if len(pieces) > 4:
+                        return None
+        return self.lookup(pieces, sqs, game.white_to_move)
+
+    def close(self):
+        for values in self.tables.values():
+            values.close()
+        self.tables = {}
+
+# Building. The first pass looks at every position once, counting the moves
+# that stay in the table and resolving the ones that leave it (captures and
+# promotions) from already built tables. Those are spread over a process pool.
+# Retrograde steps then work outward from the checkmates one ply at a time:
+# a predecessor of a lost position is won, and a position whose last
+# undecided move turns out to lead to a won position is lost.
+_builder_tables = None
+
+def _first_pass(args):
+    global _builder_tables
+    name, directory, start, stop = args
+    if _builder_tables is None or _builder_tables.directory != directory:
+        _builder_tables = Tablebases(directory)
+    pieces = table_pieces(name)
+    n = len(pieces)
+    values = bytearray(stop - start)
+    counts = bytearray(stop - start)
+    mates = array.array('L')
+    events = []  # (level, index, is_win) decided by moves that leave the table
+    for index in range(start, stop):
+        stm, sqs = _decode(index, n)
+        if not _valid(pieces, sqs, stm):
+            continue
+        count = 0
+        any_move = False
+        hold = False  # A move out of the table that draws or wins rules out a loss
+        for mover, new_sqs, captured, promotion in _moves(pieces, sqs, stm):
+            any_move = True
+            if captured < 0 and promotion is None:
+                count += 1
+                continue
+            child_pieces = pieces[:]
+            child_sqs = new_sqs[:]
+            if promotion:
+                child_pieces[mover] = promotion
+            if captured >= 0:
+                del child_pieces[captured]
+                del child_sqs[captured]
+            result = _builder_tables.lookup(child_pieces, child_sqs, stm == 1)
+            if result is None:
+                raise RuntimeError(f"{name} needs the {canonical(material_name(child_pieces))[0]} table")
+            outcome, plies = result
+            if outcome < 0:
+                events.append((plies + 1, index, True))
+                hold = True
+            elif outcome == 0:
+                hold = True
+            else:
+                events.append((plies + 1, index, False))
+                count += 1
+        if not any_move:
+            king = sqs[stm]
+            occupied = sum(1 << sq for sq in sqs)
+            if _attacked(king, "bw"[stm], pieces, sqs, occupied):
+                values[index - start] = 1  # Checkmated: mated in 0 plies
+                mates.append(index)
+            continue
+        counts[index - start] = count + hold
+    return start, bytes(values), bytes(counts), mates, events
+
+def build_table(name, directory, workers=None, log=print):
+    """Build one table into directory, picking up a saved checkpoint if there is one"""
+    tables = Tablebases(directory)
+    path = tables.path(name)
+    if os.path.exists(path):
+        return
+    checkpoint = path + ".partial"
+    pieces = table_pieces(name)
+    n = len(pieces)
+    size = 2 << (6 * n)
+
+    if os.path.exists(checkpoint):
+        with open(checkpoint, 'rb') as f:
+            state = pickle.load(f)
+        if state["pending"]:
+            log(f"{name}: resuming the first pass, {len(state['pending'])} chunks left")
+        else:
+            log(f"{name}: resuming at ply {state['level']}")
+    else:
+        chunk = max(4096, size // ((workers or os.cpu_count() or 1) * 16))
+        state = {"level": 0, "values": bytearray(size), "counts": bytearray(size),
+                 "frontier": array.array('L'), "wins": {}, "losses": {},
+                 "pending": list(range(0, size, chunk)), "chunk": chunk}
+
+    level, values, counts = state["level"], state["values"], state["counts"]
+    frontier, wins, losses = state["frontier"], state["wins"], state["losses"]
+    saved = time.monotonic()
+    if state["pending"]:
+        chunk = state["chunk"]
+        jobs = [(name, directory, start, min(start + chunk, size)) for start in state["pending"]]
+        with multiprocessing.Pool(workers) as pool:
+            for start, chunk_values, chunk_counts, mates, events in pool.imap_unordered(_first_pass, jobs):
+                values[start:start + len(chunk_values)] = chunk_values
+                counts[start:start + len(chunk_counts)] = chunk_counts
+                frontier.extend(mates)
+                for event_level, index, is_win in events:
+                    (wins if is_win else losses).setdefault(event_level, array.array('L')).append(index)
+                state["pending"].remove(start)
+                if time.monotonic() - saved > CHECKPOINT_SECONDS:
+                    _save_checkpoint(checkpoint, state)
+                    saved = time.monotonic()
+        _save_checkpoint(checkpoint, state)
+        log(f"{name}: first pass done, {len(frontier)} checkmates")
+
+    while frontier or wins or losses:
+        # Moves out of the table that decide a position at this ply
+        for index in wins.pop(level, ()):
+            if not values[index]:
+                values[index] = level + 1
+                frontier.append(index)
+        for index in losses.pop(level, ()):
+            if not values[index]:
+                counts[index] -= 1
+                if not counts[index]:
+                    values[index] = level + 1
+                    frontier.append(index)
+
+        lost = level % 2 == 0
+        following = array.array('L')
+        for index in frontier:
+            stm, sqs = _decode(index, n)
+            for previous in _unmoves(pieces, sqs, stm):
+                if values[previous]:
+                    continue
+                if lost:
+                    values[previous] = level + 2
+                    following.append(previous)
+                else:
+                    counts[previous] -= 1
+                    if not counts[previous]:
+                        values[previous] = level + 2
+                        following.append(previous)
+        level += 1
+        frontier = following
+        if time.monotonic() - saved > CHECKPOINT_SECONDS:
+            state.update(level=level, frontier=frontier)
+            _save_checkpoint(checkpoint, state)
+            saved = time.monotonic()
+            log(f"{name}: ply {level}")
+
+    with open(path + ".tmp", 'wb') as f:
+        f.write(values)
+    os.replace(path + ".tmp", path)
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    # The longest mate is the deepest ply that decided a position; level can run
+    # past it while pending win and loss events are drained
+    log(f"{name}: done, longest mate {max(values) - 1 if any(values) else 0} plies")
+
+def _save_checkpoint(path, state):
+    with open(path + ".tmp", 'wb') as f:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+def build(names, directory, workers=None, log=print):
+    """Build the named tables and everything they depend on, smallest first"""
+    os.makedirs(directory, exist_ok=True)
+    order = []
+    def visit(name):
+        if name in order or name in DRAWN_MATERIAL:
+            return
+        for needed in dependencies(name):
+            visit(needed)
+        order.append(name)
+    for name in names:
+        visit(canonical(name)[0])
+    for name in order:
+        build_table(name, directory, workers, log)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="generate tables (resumes interrupted runs)")
+    build_parser.add_argument("tables", nargs="*",
+                              help="material such as KRK or KQKR (default: all 3-piece tables)")
+    build_parser.add_argument("--four", action="store_true", help="also build every 4-piece table")
+    build_parser.add_argument("--dir", default="tablebases", help="table directory (default tablebases)")
+    build_parser.add_argument("--workers", type=int, help="processes for the first pass (default: all cores)")
+    probe_parser = commands.add_parser("probe", help="look up a position")
+    probe_parser.add_argument("fen")
+    probe_parser.add_argument("--dir", default="tablebases", help="table directory (default tablebases)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        names = args.tables or THREE_PIECE
+        if args.four:
+            names = names + FOUR_PIECE
+        build(names, args.dir, args.workers)
+        return 0
+
+    from chess_engine import ChessGame
+    game = ChessGame()
+    game.load_fen(args.fen)
+    result = Tablebases(args.dir).probe(game)
+    if result is None:
+        print("not in the tablebases")
+        return 1
+    outcome, plies = result
+    print(["lost", "draw", "won"][outcome + 1] + (f" in {plies} plies" if outcome else ""))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
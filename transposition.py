@@ -0,0 +1,137 @@
+import random
+import struct
+from multiprocessing import shared_memory
+
+# Zobrist keys, from a fixed seed so keys are stable between runs
+_rng = random.Random(20250720)
+
+ZOBRIST_PIECES = {}
+for color in ['w', 'b']:
+    for piece in ['p', 'n', 'b', 'r', 'q', 'k']:
+        ZOBRIST_PIECES[color + piece] = [_rng.getrandbits(64) for _ in range(64)]
+ZOBRIST_BLACK_TO_MOVE = _rng.getrandbits(64)
+ZOBRIST_EN_PASSANT = [_rng.getrandbits(64) for _ in range(8)]  # One per file
+
+# Castle rights are folded into a 4-bit mask (wk, wq, bk, bq) and the key
+# for a mask is the xor of the keys of its rights
+_castle_keys = [_rng.getrandbits(64) for _ in range(4)]
+ZOBRIST_CASTLE = []
+for mask in range(16):
+    key = 0
+    for i in range(4):
+        if mask >> i & 1:
+            key ^= _castle_keys[i]
+    ZOBRIST_CASTLE.append(key)
+
+def castle_mask(wk, wq, bk, bq):
+    return wk | wq << 1 | bk << 2 | bq << 3
+
+def zobrist_key(board, white_to_move, castle_rights, en_passant):
+    """Compute a position key from scratch; ChessGame updates it incrementally"""
+    key = 0
+    for r in range(8):
+        for c in range(8):
+            if board[r][c] != "--":
+                key ^= ZOBRIST_PIECES[board[r][c]][r * 8 + c]
+    if not white_to_move:
+        key ^= ZOBRIST_BLACK_TO_MOVE
+    key ^= ZOBRIST_CASTLE[castle_mask(*castle_rights)]
+    if en_passant:
+        key ^= ZOBRIST_EN_PASSANT[en_passant[1]]
+    return key
+
+# Bound types stored with each score
+EXACT = 1
+LOWER = 2  # Score is at least this (fail high)
+UPPER = 3  # Score is at most this (fail low)
+
+# Entry: key, best move, score, depth, bound, search generation; padded to 16 bytes.
+# A bucket holds a depth-preferred slot followed by an always-replace slot.
+# Entries from earlier searches lose the depth-preferred slot to any new entry.
+# The key is stored xored with the packed data, so an entry torn by two
+# search processes writing the same slot at once fails the key check.
+_ENTRY = struct.Struct('<QHhbBBx')
+_BUCKET = struct.Struct('<QHhbBBxQHhbBBx')
+
+def _check(move, score, depth, bound):
+    return move | (score & 0xFFFF) << 16 | (depth & 0xFF) << 32 | bound << 40
+
+class TranspositionTable:
+    def __init__(self, size_mb=16, buffer=None):
+        self.num_buckets = max(1, size_mb * 1024 * 1024 // _BUCKET.size)
+        # Any writable buffer will do, e.g. shared memory used by several processes
+        self.table = buffer if buffer is not None else bytearray(self.num_buckets * _BUCKET.size)
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self):
+        """Start a new generation, making entries from earlier searches replaceable"""
+        self.generation = (self.generation + 1) & 0xFF
+
+    def probe(self, key):
+        """Return (depth, bound, score, move) stored for key, or None"""
+        self.probes += 1
+        entry = _BUCKET.unpack_from(self.table, (key % self.num_buckets) * _BUCKET.size)
+        if entry[4] and entry[0] ^ _check(*entry[1:5]) == key:
+            self.hits += 1
+            return entry[3], entry[4], entry[2], entry[1]
+        if entry[10] and entry[6] ^ _check(*entry[7:11]) == key:
+            self.hits += 1
+            return entry[9], entry[10], entry[8], entry[7]
+        return None
+
+    def store(self, key, depth, bound, score, move=None):
+        self.stores += 1
+        offset = (key % self.num_buckets) * _BUCKET.size
+        stored_key, stored_move, stored_score, stored_depth, stored_bound, stored_generation = \
+            _ENTRY.unpack_from(self.table, offset)
+        stored_key ^= _check(stored_move, stored_score, stored_depth, stored_bound)
+        if stored_key == key and move is None:
+            move = stored_move  # Keep the known best move for this position
+        if (not stored_bound or stored_key == key or depth >= stored_depth
+                or stored_generation != self.generation):
+            slot = offset
+        else:
+            slot = offset + _ENTRY.size
+        move = move or 0
+        _ENTRY.pack_into(self.table, slot, key ^ _check(move, score, depth, bound),
+                         move, score, depth, bound, self.generation)
+
+    def clear(self):
+        self.table[:] = bytes(len(self.table))
+        self.generation = 0
+        self.probes = self.hits = self.stores = 0
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self):
+        return {
+            "size_mb": len(self.table) / (1024 * 1024),
+            "probes": self.probes,
+            "hits": self.hits,
+            "stores": self.stores,
+            "hit_rate": self.hit_rate()
+        }
+
+class SharedTranspositionTable(TranspositionTable):
+    """A transposition table in named shared memory, so search processes can share
+    it. The creator owns the block; other processes attach to it by name."""
+    def __init__(self, size_mb=16, name=None):
+        size = max(1, size_mb * 1024 * 1024 // _BUCKET.size) * _BUCKET.size
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.owner = name is None
+        super().__init__(size_mb, self.shm.buf[:size])
+        self.name = self.shm.name
+
+    def close(self):
+        """Detach from the block, freeing it as well if this process created it"""
+        self.table.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
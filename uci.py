@@ -0,0 +1,187 @@
+# UCI front end, so chess GUIs and match tools can drive the Hard AI.
+# The main thread reads commands from stdin while searches run on a worker
+# thread; "stop" sets an event the search polls every few hundred nodes.
+import sys
+import threading
+import time
+from chess_engine import ChessGame, move_to_uci
+from ai import ChessAI
+from constants import AI_HASH_MB, AI_THREADS
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+GO_FLAGS = ("infinite", "ponder")  # go options without a value
+STOP_CHECK_INTERVAL = 128  # Nodes between stop checks, a few milliseconds apart
+
+class UCIEngine:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.hash_mb = AI_HASH_MB
+        self.threads = AI_THREADS
+        self.ai = None
+        self.game = ChessGame()
+        self.search_thread = None
+        self.stop_event = threading.Event()
+        self.ponderhit_event = threading.Event()  # Set by "ponderhit" during go ponder
+        self.search_start = 0.0
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def engine(self):
+        """The ChessAI, created on first use so setoption can resize it first"""
+        if self.ai is None:
+            self.ai = ChessAI("hard", self.hash_mb, self.threads)
+            self.ai.stop_event = self.stop_event
+            self.ai.check_interval = STOP_CHECK_INTERVAL
+            self.ai.on_iteration = self.report
+        return self.ai
+
+    def handle(self, line):
+        """Run one command; returns False on quit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send("id name chess_game_ai")
+            self.send("id author isthatpratham")
+            self.send(f"option name Hash type spin default {AI_HASH_MB} min 1 max 4096")
+            self.send(f"option name Threads type spin default {AI_THREADS} min 1 max 64")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "ucinewgame":
+            self.stop_search()
+            if self.ai:
+                self.ai.new_game()
+        elif command == "position":
+            self.stop_search()
+            self.set_position(args)
+        elif command == "go":
+            self.stop_search()
+            self.go(args)
+        elif command == "stop":
+            self.stop_search()
+        elif command == "ponderhit":
+            # The pondered move was played; the search keeps its clock limits and
+            # may answer as soon as it is done
+            self.ponderhit_event.set()
+        elif command == "quit":
+            self.stop_search()
+            if self.ai:
+                self.ai.close()
+            return False
+        return True
+
+    def set_option(self, args):
+        # setoption name <name> value <value>
+        if "name" not in args or "value" not in args:
+            return
+        name = ' '.join(args[args.index("name") + 1:args.index("value")]).lower()
+        value = ' '.join(args[args.index("value") + 1:])
+        if name not in ("hash", "threads"):
+            return
+        self.stop_search()
+        if name == "hash":
+            self.hash_mb = max(1, int(value))
+        else:
+            self.threads = max(1, int(value))
+        if self.ai:
+            self.ai.close()
+            self.ai = None
+
+    def set_position(self, args):
+        # position [startpos | fen <fen>] [moves <move> ...]
+        moves_at = args.index("moves") if "moves" in args else len(args)
+        if args and args[0] == "fen":
+            self.game.load_fen(' '.join(args[1:moves_at]))
+        else:
+            self.game.load_fen(START_FEN)
+        for text in args[moves_at + 1:]:
+            move = next((m for m in self.game.generate_legal_moves() if move_to_uci(m) == text), None)
+            if move is None:
+                self.send(f"info string illegal move {text}")
+                break
+            self.game.make_move(move)
+
+    def go(self, args):
+        options = {}
+        i = 0
+        while i < len(args):
+            if args[i] in GO_FLAGS:
+                options[args[i]] = True
+                i += 1
+            elif i + 1 < len(args):
+                options[args[i]] = args[i + 1]
+                i += 2
+            else:
+                i += 1
+        self.engine()
+        game = self.game
+        # The clock only counts when the GUI sends it; movetime and nodes cap it further
+        game.white_time = int(options["wtime"]) / 1000 if "wtime" in options else float("inf")
+        game.black_time = int(options["btime"]) / 1000 if "btime" in options else float("inf")
+        depth = int(options["depth"]) if "depth" in options else None
+        movetime = int(options["movetime"]) / 1000 if "movetime" in options else None
+        nodes = int(options["nodes"]) if "nodes" in options else None
+        infinite = "infinite" in options
+        if infinite:
+            movetime = float("inf")
+            game.white_time = game.black_time = float("inf")
+        self.stop_event.clear()
+        self.ponderhit_event.clear()
+        self.search_thread = threading.Thread(target=self.search,
+                                              args=(depth, movetime, nodes, infinite, "ponder" in options),
+                                              daemon=True)
+        self.search_thread.start()
+
+    def search(self, depth, movetime, nodes, infinite, ponder):
+        self.search_start = time.perf_counter()
+        move = self.ai.find_best_move(self.game, depth, movetime, nodes)
+        if infinite:
+            # UCI only allows the answer after "stop", even if the search is done
+            self.stop_event.wait()
+        elif ponder:
+            # Likewise after "stop" or "ponderhit" when pondering
+            while not (self.stop_event.is_set() or self.ponderhit_event.is_set()):
+                self.stop_event.wait(0.01)
+        self.send(f"bestmove {move_to_uci(move) if move is not None else '0000'}")
+
+    def report(self, depth, score, move):
+        """info line for a completed iteration; scores are from the side to move's view"""
+        elapsed = max(time.perf_counter() - self.search_start, 1e-6)
+        pv = self.ai.principal_variation(self.game, move, depth)
+        if not self.game.white_to_move:
+            score = -score
+        if abs(score) >= 9999:
+            plies = len(pv)
+            score_text = f"mate {(plies + 1) // 2 if score > 0 else -(plies // 2)}"
+        else:
+            score_text = f"cp {score}"
+        self.send(f"info depth {depth} score {score_text} nodes {self.ai.nodes} "
+                  f"nps {int(self.ai.nodes / elapsed)} time {int(elapsed * 1000)} "
+                  f"pv {' '.join(move_to_uci(m) for m in pv)}")
+
+    def stop_search(self):
+        """Stop a running search and wait for it to print its bestmove"""
+        self.stop_event.set()
+        if self.search_thread is not None:
+            self.search_thread.join()
+            self.search_thread = None
+
+def main():
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    else:
+        engine.handle("quit")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())